@@ -0,0 +1,10 @@
+import os
+
+# The test_widget_*.py scripts open interactive windows at import time,
+# they are run by hand and must not be collected by pytest.
+collect_ignore_glob = ['test_widget_*.py']
+
+# HamamatsuCamera runs on the DCAM simulator, this must be set before
+# hardware.dcamapi4 is imported by any test module.
+os.environ.setdefault('DCAMAPI_SIMULATOR','1')
+os.environ.setdefault('QT_QPA_PLATFORM','offscreen')
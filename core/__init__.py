@@ -1,3 +1,4 @@
 from .utils import *
 from .worker import *
 from .z_lock import *
+from .metadata import *
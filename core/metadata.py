@@ -0,0 +1,173 @@
+import numpy as np
+import json
+import sys
+from datetime import datetime
+from os import makedirs
+from os.path import join,exists,splitext
+
+############################################################################### Columnar per-frame metadata
+
+# One raw little-endian file per column, appended in chunks and memory-mapped
+# on read. Text fields (laser and filter names) stay in the CSV.
+METADATA_COLUMNS = (
+    ('frame_index'   ,'<i8'),
+    ('host_time'     ,'<f8'),
+    ('hw_timestamp'  ,'<f8'),
+    ('hw_frame_index','<i8'),
+    ('x'             ,'<i8'),
+    ('y'             ,'<i8'),
+    ('z'             ,'<i8'),
+    ('laser_index'   ,'<f8'), # NaN when no laser is on
+    ('laser_power'   ,'<f8'),
+    ('filter_pos'    ,'<i4'),
+    ('state_version' ,'<i8'),
+)
+
+# host_time is either 'perf_counter' seconds, converted to epoch seconds by
+# adding host_clock_offset, or already 'epoch' seconds (first CSV layout).
+HOST_TIME_BASES = ('perf_counter','epoch')
+
+class FrameMetadataWriter():
+
+    def __init__(self,path,host_clock_offset=None,host_time_base='perf_counter',chunk_size=1024):
+        assert host_time_base in HOST_TIME_BASES, f'Unknown host time base {host_time_base}'
+        makedirs(path,exist_ok=True)
+        with open(join(path,'columns.json'),'w') as file:
+            json.dump({'columns':           [list(column) for column in METADATA_COLUMNS],
+                       'host_time_base':    host_time_base,
+                       'host_clock_offset': host_clock_offset},file,indent=1)
+
+        self.path       = path
+        self.chunk_size = chunk_size
+        self.n_buffered = 0
+        self.buffers    = {name: np.zeros(chunk_size,dtype) for name,dtype in METADATA_COLUMNS}
+        self.files      = {name: open(join(path,name+'.bin'),'wb') for name,_ in METADATA_COLUMNS}
+
+    def append(self,**values):
+        for name,_ in METADATA_COLUMNS:
+            self.buffers[name][self.n_buffered] = values.get(name,0)
+        self.n_buffered += 1
+        if self.n_buffered == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        for name,_ in METADATA_COLUMNS:
+            self.files[name].write( self.buffers[name][:self.n_buffered].tobytes() )
+        self.n_buffered = 0
+
+    def close(self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+def load_metadata_info(path) -> dict:
+    # Contents of columns.json: columns, host_time_base and host_clock_offset
+    with open(join(path,'columns.json'),'r') as file:
+        info = json.load(file)
+    info.setdefault('host_time_base','perf_counter')
+    info.setdefault('host_clock_offset',None)
+    return info
+
+def load_frame_metadata(path) -> dict:
+    # Returns {column: read-only memory-mapped array}
+    metadata = {}
+    for name,dtype in load_metadata_info(path)['columns']:
+        column_file = join(path,name+'.bin')
+        if not exists(column_file) or np.dtype(dtype).itemsize > _file_size(column_file):
+            metadata[name] = np.zeros(0,dtype)
+        else:
+            metadata[name] = np.memmap(column_file,dtype=dtype,mode='r')
+    return metadata
+
+def load_epoch_host_time(path):
+    # host_time in seconds since the epoch, None if the clock offset is unknown
+    info      = load_metadata_info(path)
+    host_time = load_frame_metadata(path)['host_time']
+    if info['host_time_base'] == 'epoch':
+        return np.array(host_time)
+    if info['host_clock_offset'] is None:
+        print(f'{path}: host_time is perf_counter seconds without a known clock offset')
+        return None
+    return host_time + info['host_clock_offset']
+
+def _file_size(file_name):
+    with open(file_name,'rb') as file:
+        return file.seek(0,2)
+
+def _parse_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan # e.g. 'none' laser index
+
+def _parse_time(text):
+    # Seconds, or str(datetime) as written by the first CSV layout
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return np.nan
+
+# CSV header name -> (column, parser). Covers the original layout
+# (N_FRAME,TIMESTAMP,X,Y,Z,...) and the later HOST_TIME/HW_* layout.
+CSV_COLUMNS = {
+    'N_FRAME':          ('frame_index'   ,int),
+    'TIMESTAMP':        ('host_time'     ,_parse_time),
+    'HOST_TIME':        ('host_time'     ,_parse_time),
+    'HW_TIMESTAMP':     ('hw_timestamp'  ,_parse_float),
+    'HW_FRAME_INDEX':   ('hw_frame_index',int),
+    'X':                ('x'             ,int),
+    'Y':                ('y'             ,int),
+    'Z':                ('z'             ,int),
+    'LASER_INDEX':      ('laser_index'   ,_parse_float),
+    'LASER_VALUE':      ('laser_power'   ,_parse_float),
+    'FILTER_WHEEL_POS': ('filter_pos'    ,int),
+    'STATE_VERSION':    ('state_version' ,int),
+}
+
+# Values for columns missing from older CSVs
+CSV_DEFAULTS = {'hw_timestamp': np.nan, 'hw_frame_index': -1, 'laser_index': np.nan}
+
+def convert_csv_metadata(csv_file,path=None):
+    # Builds the columnar sidecar of a dataset CSV, columns are mapped by header name.
+    # The original layout has datetime TIMESTAMPs (epoch base), the later one
+    # perf_counter HOST_TIMEs with an optional '# HOST_CLOCK_OFFSET=' line.
+    if path is None:
+        path = splitext(csv_file)[0]+'_meta'
+
+    with open(csv_file,'r') as file:
+        lines = file.readlines()
+    header  = lines[0].lstrip('#').strip().split(',')
+    mapping = [(i,)+CSV_COLUMNS[name] for i,name in enumerate(header) if name in CSV_COLUMNS]
+    
+    if 'TIMESTAMP' in header:
+        host_time_base,host_clock_offset = 'epoch',0.0
+    else:
+        host_time_base,host_clock_offset = 'perf_counter',None
+        for line in lines[1:]:
+            if line.startswith('# HOST_CLOCK_OFFSET='):
+                host_clock_offset = float(line.split('=',1)[1])
+                break
+
+    writer = FrameMetadataWriter(path,host_clock_offset,host_time_base)
+    for line in lines[1:]:
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = line.rstrip('\n').split(',')
+        values = dict(CSV_DEFAULTS)
+        for i,column,parse in mapping:
+            values[column] = parse(fields[i])
+        writer.append(**values)
+    writer.close()
+    return path
+
+if __name__ == '__main__':
+    # python -m core.metadata dataset.csv [dataset_meta]
+    if len(sys.argv) < 2:
+        print('Usage: python -m core.metadata <metadata.csv> [output_dir]')
+    else:
+        out_path = convert_csv_metadata(sys.argv[1],sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f'Columnar metadata written to {out_path}')
@@ -1,6 +1,7 @@
 import numpy as np
 from numba import jit
 from glob import glob
+from time import perf_counter
 
 ############################################################################### Svg add dark theme
 
@@ -47,8 +48,7 @@ class FixedSizeNumpyQueue():
         
 ############################################################################### Numpy based fixed-sized queue
 
-#@jit(nopython=True,nogil=True,cache=True)
-@jit(nopython=True)
+@jit(nopython=True,nogil=True,cache=True)
 def get_min_max_avg(array):
     min_val =  np.inf
     max_val = -np.inf
@@ -60,3 +60,163 @@ def get_min_max_avg(array):
         avg_val = avg_val + val
     
     return min_val,max_val,avg_val/array.size
+
+############################################################################### Histogram based statistics
+
+@jit(nopython=True,nogil=True,cache=True)
+def get_histogram_u16(array,hist):
+    # hist must have 65536 bins, it is overwritten
+    hist[:] = 0
+    for i in range(array.shape[0]):
+        for j in range(array.shape[1]):
+            hist[array[i,j]] += 1
+    return hist
+
+@jit(nopython=True,nogil=True,cache=True)
+def get_histogram_limits(hist,outlier_fraction):
+    # Returns the (outlier_fraction,1-outlier_fraction) percentiles and min/max/avg
+    n_total = hist.sum()
+    if n_total == 0:
+        return 0,0,0,0,0.0
+    lo_count = outlier_fraction*n_total
+    hi_count = (1-outlier_fraction)*n_total
+    
+    v_lo  = -1
+    v_hi  = -1
+    v_min = -1
+    v_max = 0
+    cum   = 0
+    total = 0.0
+    for val in range(hist.size):
+        count = hist[val]
+        if count == 0:
+            continue
+        if v_min < 0:
+            v_min = val
+        v_max  = val
+        cum   += count
+        total += val*count
+        if v_lo < 0 and cum > lo_count:
+            v_lo = val
+        if v_hi < 0 and cum >= hi_count:
+            v_hi = val
+    return v_lo,v_hi,v_min,v_max,total/n_total
+
+############################################################################### Display kernels
+
+@jit(nopython=True,nogil=True,cache=True)
+def render_u16_lut(frame,out,hist,orientation,lut,binning):
+    # Single pass over a uint16 frame: applies the orientation (0: none,
+    # 1: vertical flip, 2: rot180), fills hist with every pixel and writes
+    # lut[block max] of each binning x binning block into out, which must be
+    # ceil(shape/binning). The max keeps isolated bright spots visible.
+    hist[:] = 0
+    n_rows,n_cols = frame.shape
+    n_out_rows,n_out_cols = out.shape
+    for bi in range(n_out_rows):
+        i0 = bi*binning
+        i1 = min(i0+binning,n_rows)
+        if orientation > 0:
+            dst_i = n_out_rows-1-bi
+        else:
+            dst_i = bi
+        for bj in range(n_out_cols):
+            j0 = bj*binning
+            j1 = min(j0+binning,n_cols)
+            if orientation == 2:
+                dst_j = n_out_cols-1-bj
+            else:
+                dst_j = bj
+            v_blk = 0
+            for i in range(i0,i1):
+                for j in range(j0,j1):
+                    val = frame[i,j]
+                    hist[val] += 1
+                    if val > v_blk:
+                        v_blk = val
+            out[dst_i,dst_j] = lut[v_blk]
+
+@jit(nopython=True,nogil=True,cache=True)
+def get_boxes_stats(frame,boxes,out):
+    # One pass over all boxes (x0,y0,x1,y1, end exclusive) writing mean,sum,max
+    for k in range(boxes.shape[0]):
+        x0 = boxes[k,0]
+        y0 = boxes[k,1]
+        x1 = boxes[k,2]
+        y1 = boxes[k,3]
+        total = 0.0
+        v_max = 0.0
+        for i in range(y0,y1):
+            for j in range(x0,x1):
+                val = frame[i,j]
+                total += val
+                if val > v_max:
+                    v_max = val
+        n_pix = (y1-y0)*(x1-x0)
+        out[k,0] = total/n_pix if n_pix > 0 else 0.0
+        out[k,1] = total
+        out[k,2] = v_max
+
+############################################################################### Display LUTs
+
+# Anchor colors, linearly interpolated along the normalized intensity
+DISPLAY_COLORMAPS = {
+    'gray'   : ((0,0,0),(255,255,255)),
+    'hot'    : ((0,0,0),(230,0,0),(255,210,0),(255,255,255)),
+    'fire'   : ((0,0,0),(0,0,160),(190,0,190),(255,80,0),(255,220,0),(255,255,255)),
+    'green'  : ((0,0,0),(0,255,0)),
+    'magenta': ((0,0,0),(255,0,255)),
+    'cyan'   : ((0,0,0),(0,255,255)),
+}
+
+def build_display_lut(v_lo,v_hi,gamma=1.0,colormap='gray'):
+    # 65536 entries mapping a uint16 value to a display pixel: uint8 for 'gray'
+    # (QImage Grayscale8), 0xFFRRGGBB uint32 for any other colormap (RGB32).
+    # gamma < 1 brightens the dim end of the range.
+    x = np.arange(65536,dtype=np.float32)
+    x = np.clip( (x-v_lo)/max(v_hi-v_lo,1), 0, 1 )
+    if gamma != 1:
+        x = x**gamma
+    
+    if colormap == 'gray':
+        return np.uint8( np.round( 255*x ) )
+    
+    anchors = np.float32( DISPLAY_COLORMAPS[colormap] )
+    pos = np.linspace(0,1,anchors.shape[0])
+    r = np.uint32( np.round( np.interp(x,pos,anchors[:,0]) ) )
+    g = np.uint32( np.round( np.interp(x,pos,anchors[:,1]) ) )
+    b = np.uint32( np.round( np.interp(x,pos,anchors[:,2]) ) )
+    return np.uint32(0xFF000000) | (r<<16) | (g<<8) | b
+
+############################################################################### Numba warm-up
+
+# Signatures compiled, or loaded from the on-disk cache, during start-up.
+# Ring slots and display buffers are C-contiguous.
+KERNEL_SIGNATURES = (
+    (get_min_max_avg     , ('(uint16[:,::1],)',
+                            '(float32[:,::1],)')),
+    (get_histogram_u16   , ('(uint16[:,::1],int64[::1])',)),
+    (get_histogram_limits, ('(int64[::1],float64)',)),
+    (render_u16_lut      , ('(uint16[:,::1],uint8[:,::1],int64[::1],int64,uint8[::1],int64)',
+                            '(uint16[:,::1],uint32[:,::1],int64[::1],int64,uint32[::1],int64)')),
+    (get_boxes_stats     , ('(uint16[:,::1],int32[:,::1],float64[:,::1])',
+                            '(uint32[:,::1],int32[:,::1],float64[:,::1])')),
+)
+
+def warmup_kernels(report=None):
+    # Compiles every kernel so that the first frame does not wait for the JIT.
+    # Returns [(kernel_name,ms)], report(str) is called after each kernel.
+    timings = []
+    t_start = perf_counter()
+    for kernel,signatures in KERNEL_SIGNATURES:
+        t_kernel = perf_counter()
+        for signature in signatures:
+            kernel.compile(signature)
+        timings.append( (kernel.__name__,1000*(perf_counter()-t_kernel)) )
+        if report is not None:
+            report(f'{timings[-1][0]}: {timings[-1][1]:.0f} ms')
+    
+    print(f'Numba warm-up: {1000*(perf_counter()-t_start):.0f} ms')
+    for name,ms in timings:
+        print(f'    {name:<24}{ms:8.1f} ms')
+    return timings
@@ -60,11 +60,13 @@ class Worker(QObject):
         if save_main:
             self.main_saver.enable_autosave()
             self.main_saver.start_acquisition(save_main,n_steps + 1)
+            self.main_cam.open_snap_session()
             self.main_cam.snap_frame()
             
         if save_aux:
             self.aux_saver.enable_autosave()
             self.aux_saver.start_acquisition(save_aux,n_steps + 1)
+            self.aux_cam.open_snap_session()
             self.aux_cam.snap_frame()
             
         for _ in range(n_steps):
@@ -82,6 +84,12 @@ class Worker(QObject):
             
         self.should_process = False
         
+        if save_main:
+            self.main_cam.close_snap_session()
+            
+        if save_aux:
+            self.aux_cam.close_snap_session()
+        
         sleep(0.5)
         
         if save_main:
@@ -101,10 +109,12 @@ class Worker(QObject):
         
         if save_main:
             self.main_saver.start_acquisition(save_main,n_steps + 1)
+            self.main_cam.open_snap_session()
             self.main_cam.snap_frame()
             
         if save_aux:
             self.aux_saver.start_acquisition(save_aux,n_steps + 1)
+            self.aux_cam.open_snap_session()
             self.aux_cam.snap_frame()
             
         for ite in range(n_steps):
@@ -124,6 +134,12 @@ class Worker(QObject):
             
         self.should_process = False
         
+        if save_main:
+            self.main_cam.close_snap_session()
+            
+        if save_aux:
+            self.aux_cam.close_snap_session()
+        
         sleep(0.5)
         
         if save_main:
@@ -1,13 +1,18 @@
 from PyQt5.QtCore import QObject, QThread, pyqtSlot, pyqtSignal
 import warnings
 import numpy as np
-from scipy.ndimage import gaussian_filter
-from scipy.optimize import curve_fit
-from scipy.optimize import OptimizeWarning
 from enum import IntEnum
 
 from core import FixedSizeNumpyQueue
 
+curve_fit = None # scipy.optimize.curve_fit, imported when the lock starts
+
+def _import_scipy():
+    global curve_fit
+    if curve_fit is None:
+        from scipy.optimize import curve_fit as _curve_fit
+        curve_fit = _curve_fit
+
 def _GaussWLinear(x, a0, u0, s0, m0, o0):
     return a0 * np.exp(-(x - u0)**2 / (2 * s0**2)) + m0*x + o0
 
@@ -85,6 +90,7 @@ class ZLock(QObject):
         self.should_process = False
     
     def start(self):
+        _import_scipy()
         self.ratio_queue.clear()
         self.should_process = True
     
@@ -116,6 +122,7 @@ class ZLock(QObject):
         
         std = None
         
+        _import_scipy()
         popt,pcov,_,msg,ier = curve_fit(_GaussWLinear,axis,proj,init_values,full_output=True)
         
         if 'popt' not in locals() or 'pcov' not in locals():
@@ -130,10 +137,12 @@ class ZLock(QObject):
         
         return std
 
-    @pyqtSlot()
-    def got_frame(self):
+    @pyqtSlot(int)
+    def got_frame(self,seq):
         if self.should_process:
-            frame = np.copy( self.aux_cam.frame_buffer )
+            frame = self.aux_cam.get_frame(seq)
+            if frame is None:
+                return
             if (frame.shape[0]<self.frame_size_min) or (frame.shape[1]<self.frame_size_min):
                 self.error_reporting.emit(ZLock.ReportType.TYPE_WARN,ZLock.ReportCode.MIN_FRAME_ERR,
                                           f'Image is {frame.shape[0]} by {frame.shape[1]}, should be at least {self.frame_size_min}')
@@ -147,8 +156,13 @@ class ZLock(QObject):
                 return
             
             
-            std_x = self._estimate_std( frame.mean(axis=1) )
-            std_y = self._estimate_std( frame.mean(axis=0) )
+            proj_x = frame.mean(axis=1)
+            proj_y = frame.mean(axis=0)
+            if not self.aux_cam.is_frame_valid(seq):
+                return
+            
+            std_x = self._estimate_std( proj_x )
+            std_y = self._estimate_std( proj_y )
             
             if std_x is None or std_y is None:
                 ratio_raw = None
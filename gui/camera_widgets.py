@@ -1,33 +1,171 @@
 from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
-from PyQt5.QtCore import QElapsedTimer, QPoint, QRectF, QPointF
+from PyQt5.QtCore import QElapsedTimer, QPoint, QRectF, QPointF, QTimer
 from PyQt5.QtWidgets import QWidget, QOpenGLWidget
 from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGridLayout, QFormLayout
-from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGraphicsPixmapItem, QGraphicsItem
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsView, QGraphicsPixmapItem, QGraphicsItem, QGraphicsRectItem
 from PyQt5.QtWidgets import QLabel, QLineEdit, QSpinBox, QPushButton
-from PyQt5.QtWidgets import QFrame
-from PyQt5.QtGui import QImage, QPixmap, QFont, QPalette, QColor, QTransform
-from PyQt5.QtGui import QPainter, QPen, QBrush, QWheelEvent
+from PyQt5.QtWidgets import QFrame, QCheckBox
+from PyQt5.QtGui import QImage, QPixmap, QFont, QPalette, QColor, QTransform, QGuiApplication
+from PyQt5.QtGui import QPainter, QPen, QBrush, QWheelEvent, QPolygonF
 import numpy as np
 from core.utils import FixedSizeNumpyQueue,get_min_max_avg
-from ndstorage import NDTiffDataset
+from core.utils import get_histogram_u16,get_histogram_limits,render_u16_lut
+from core.utils import build_display_lut,DISPLAY_COLORMAPS,get_boxes_stats
+from core.metadata import FrameMetadataWriter
 from gui.ui_utils import IconProvider,IntMultipleOfValidator, SteppingSpinBox
 from gui.ui_utils import create_iconized_button,update_iconized_button
 from gui.ui_utils import create_int_line_edit,create_combo_box,create_doublespinbox
 from gui.ui_utils import StyledFrame
+from hardware.cameras import FRAME_STAGES
 from os.path import join,normpath
-from os import makedirs
+from os import makedirs,remove,rmdir
+from threading import Lock,Condition,Thread
+from collections import deque
+from time import perf_counter
 
 ############################################################################### Image to NDTiff helper
 
+SAVE_QUEUE_POLICIES = ('block','drop','spill')
+
+class FrameWriteQueue():
+    # FIFO of save commands ('start','frame','finish') between the producers
+    # (camera thread, GUI, z-sweep worker) and the writer thread. Only frames
+    # held in memory count against max_frames. When full, put_frame drops the
+    # frame, hands it to the spill thread, which moves it to entry['spill_dir']
+    # while it waits in the queue, or blocks the producer, depending on policy.
+    # 'block' stalls the camera thread and is only meant for producers that
+    # can wait (e.g. a z-sweep). Under 'spill' a frame is only dropped when
+    # writing it to the spill directory fails.
+    
+    def __init__(self,max_frames=64,policy='spill'):
+        self.entries    = deque()
+        self.cond       = Condition()
+        self.max_frames = max_frames
+        self.policy     = policy
+        self.n_memory   = 0
+        self.max_depth  = 0
+        self.n_dropped  = 0
+        self.n_spilled  = 0
+        self.n_spill_files = 0
+        
+        self._spill_running = True
+        self._spill_thread  = Thread(target=self._spill_loop,name='FrameSpill',daemon=True)
+        self._spill_thread.start()
+    
+    def close(self):
+        with self.cond:
+            self._spill_running = False
+            self.cond.notify_all()
+        self._spill_thread.join()
+    
+    def depth(self):
+        return len(self.entries)
+    
+    def set_policy(self,policy,max_frames=None):
+        assert policy in SAVE_QUEUE_POLICIES, f'Unknown queue policy {policy}'
+        with self.cond:
+            self.policy = policy
+            if max_frames is not None:
+                self.max_frames = max_frames
+            self.cond.notify_all()
+    
+    def put_command(self,command,args=()):
+        with self.cond:
+            self.entries.append((command,args))
+            self.cond.notify_all()
+    
+    def put_frame(self,entry) -> bool:
+        # Never does I/O, frames over max_frames wait in memory for the spill thread
+        with self.cond:
+            if self.policy == 'block':
+                while self.n_memory >= self.max_frames and self.policy == 'block':
+                    self.cond.wait()
+            if self.n_memory >= self.max_frames and self.policy != 'spill':
+                self.n_dropped += 1
+                return False
+            self.n_memory += 1
+            self.entries.append(('frame',entry))
+            self.max_depth = max(self.max_depth,len(self.entries))
+            self.cond.notify_all()
+        return True
+    
+    def _next_overflow(self):
+        # Newest in-memory frame beyond max_frames, None if within the limit
+        if self.policy != 'spill' or self.n_memory <= self.max_frames:
+            return None
+        for command,args in reversed(self.entries):
+            if command == 'frame' and args['frame'] is not None and not args.get('spilling'):
+                return args
+        return None
+    
+    def _spill_loop(self):
+        while True:
+            with self.cond:
+                entry = self._next_overflow()
+                while entry is None and self._spill_running:
+                    self.cond.wait()
+                    entry = self._next_overflow()
+                if not self._spill_running:
+                    return
+                entry['spilling'] = True
+                frame     = entry['frame']
+                spill_dir = entry['spill_dir']
+            
+            spill_file = join(spill_dir,f'{self.n_spill_files:08d}.npy')
+            self.n_spill_files += 1
+            try:
+                makedirs(spill_dir,exist_ok=True)
+                np.save(spill_file,frame)
+                error = None
+            except OSError as e:
+                error = e
+            
+            with self.cond:
+                entry['spilling'] = False
+                if entry.get('taken'):
+                    # The writer got to it first, the spilled copy is not needed
+                    if error is None:
+                        remove(spill_file)
+                    continue
+                if error is not None:
+                    print(f'Cannot spill frame to {spill_file} ({error}), dropping it')
+                    entry['dropped'] = True
+                    self.n_dropped  += 1
+                else:
+                    entry['spill_file'] = spill_file
+                    self.n_spilled += 1
+                entry['frame'] = None
+                self.n_memory -= 1
+                self.cond.notify_all()
+    
+    def get(self):
+        while True:
+            with self.cond:
+                if not self.entries:
+                    return None
+                command,args = self.entries.popleft()
+                if command == 'frame':
+                    args['taken'] = True
+                    if args.get('dropped'):
+                        continue
+                    if args['frame'] is not None:
+                        self.n_memory -= 1
+                        self.cond.notify_all()
+            break
+        
+        if command == 'frame' and args['frame'] is None:
+            args['frame'] = np.load(args['spill_file'])
+            remove(args['spill_file'])
+        return command,args
+
 class ImageToNDTiff(QObject):
     finish_saving   = pyqtSignal()
     saving_progress = pyqtSignal(str)
+    _write          = pyqtSignal()
     
-    def __init__(self,camera_thread):
+    def __init__(self,camera_thread,max_queue_frames=64,policy='spill'):
         super().__init__()
         self._cam = camera_thread
-        self.current_file  = None
-        self.metadata_file = None
         self.is_acquiring  = False
         self.process       = True
         self.frame_count   = 0
@@ -37,6 +175,30 @@ class ImageToNDTiff(QObject):
         self.skip_limit   = 0
         
         self.dev_manager = None
+        
+        # Producer side: frames are copied out of the ring when they are
+        # published and queued, the writer thread drains the queue in order.
+        self.state_lock  = Lock()
+        self.write_queue = FrameWriteQueue(max_queue_frames,policy)
+        self.dataset_spill_dir = None
+        self._write_scheduled = False
+        self._write.connect( self.write_pending )
+        
+        # Writer side
+        self.current_file   = None
+        self.metadata_file  = None
+        self.metadata_rows  = []  # CSV rows, flushed every metadata_block frames
+        self.metadata_block = 256
+        self.save_binary_metadata = False # columnar sidecar next to the CSV
+        self.metadata_bin   = None
+        self.spill_dir      = None
+        self.written_count  = 0
+        self.written_max    = 0
+        self.write_fps      = 0
+        self.write_mbps     = 0
+        self._rate_t0       = perf_counter()
+        self._rate_frames   = 0
+        self._rate_bytes    = 0
     
     def enable_autosave(self):
         self.process = True
@@ -44,76 +206,87 @@ class ImageToNDTiff(QObject):
     def disable_autosave(self):
         self.process = False
     
+    def set_queue_policy(self,policy,max_frames=None):
+        self.write_queue.set_policy(policy,max_frames)
+    
+    def _schedule_write(self):
+        if not self._write_scheduled:
+            self._write_scheduled = True
+            self._write.emit()
+    
+    ######################################################### Producer side
+    
     def dataset_start(self,work_dir,filename,num_frames=-1):
-        if self.is_acquiring:
+        with self.state_lock:
+            if self.is_acquiring:
+                return
+            
+            self.is_acquiring = True
+            self.max_count    = num_frames
+            self.frame_count  = 0
+            self.skip_counter = 0
+            self.dataset_spill_dir = normpath(join(work_dir,filename))+'_spill'
+            self.write_queue.put_command('start',(work_dir,filename,num_frames,self.dataset_spill_dir))
+        self._schedule_write()
+    
+    def _device_metadata(self):
+        # (version,state) snapshot pushed by the devices, see DeviceStateStore
+        if self.dev_manager is None:
+            return 0,{}
+        return self.dev_manager.state.snapshot()
+        
+    def dataset_push_frame(self,seq=None):
+        if not self.is_acquiring:
+            name = f'{self._cam.uid}: [{self._cam.vendor} - {self._cam.model}'
+            print(f'[{name}]: pushing frame to invalid dataset')
             return
         
-        self.is_acquiring = True
-        self.max_count    = num_frames
-        self.frame_count  = 0
-        self.skip_counter = 0
-        
-        print(f'Starting {filename}')
-        summary_metadata  = {'CameraUniqueId': self._cam.uid,
-                             'CameraVendor':   self._cam.vendor,
-                             'CameraModel':    self._cam.model,
-                             'PixelSizeNM':    self._cam.pix_size_nm}
-        makedirs(filename,exist_ok=True)
-        self.current_file  = NDTiffDataset(work_dir,name=filename,summary_metadata=summary_metadata,writable=True)
-        self.metadata_file = open(normpath(join(self.current_file.path,filename))+'.csv','w')
-        self.metadata_file.write('#N_FRAME,TIMESTAMP,X,Y,Z,LASER_INDEX,LASER_ON_NAME,LASER_VALUE,LASER_UNIT,FILTER_WHEEL_POS,FILTER_WHEEL_NAME\n')
-        
-    def dataset_push_frame(self):
-        if self.current_file is None:
+        if seq is None:
+            seq = self._cam.frame_seq
+        frame = self._cam.get_frame(seq)
+        if frame is not None:
+            frame = frame.copy()
+        if frame is None or not self._cam.is_frame_valid(seq):
             name = f'{self._cam.uid}: [{self._cam.vendor} - {self._cam.model}'
-            print(f'[{name}]: pushing frame to invalid dataset')
+            print(f'[{name}]: frame {seq} was overwritten before saving')
+            self._cam.pipeline_stats.count_drop('disk')
             return
         
-        if self.dev_manager and hasattr(self.dev_manager,'Stage'):
-            md_coord = {'x': self.dev_manager.Stage.step_counter['x'],
-                        'y': self.dev_manager.Stage.step_counter['y'],
-                        'z': self.dev_manager.Stage.step_counter['z'],
-                        't': self.frame_count}
+        entry = {'seq':         seq,
+                 'frame':       frame,
+                 'stamps':      self._cam.get_frame_stamps(seq),
+                 'frame_count': self.frame_count,
+                 'devices':     self._device_metadata(),
+                 'spill_dir':   self.dataset_spill_dir}
+        if self.write_queue.put_frame(entry):
+            self.frame_count = self.frame_count + 1
         else:
-            md_coord = {'x': 0, 'y': 0, 'z': 0, 't': self.frame_count}
-        md_img = {'timestamp': str(self._cam.timestamp),
-                  'frame_count': self.frame_count}
-        self.current_file.put_image(md_coord,self._cam.frame_buffer,md_img)
-        laser_index,laser_name,laser_power,laser_units = self.dev_manager.get_active_laser()
-        x = self.dev_manager.Stage.step_counter['x']
-        y = self.dev_manager.Stage.step_counter['y']
-        z = self.dev_manager.Stage.step_counter['z']
-        self.metadata_file.write(f'{self.frame_count},{str(self._cam.timestamp)},')
-        self.metadata_file.write(f'{x},{y},{z},')
-        self.metadata_file.write(f'{laser_index},{laser_name},{laser_power},{laser_units},')
-        self.metadata_file.write(f'{self.dev_manager.FilterWheel.pos},{self.dev_manager.FilterWheel.current_position_name()}\n')
-        self.frame_count = self.frame_count + 1
+            self._cam.pipeline_stats.count_drop('disk')
+        self._schedule_write()
         
     def dataset_check_done_state(self):
         if self.max_count < 0:
             return False
         return self.frame_count >= self.max_count
         
-    def dataset_finish(self):
-        if self.current_file is None:
-            return
-        
-        self.current_file.finish()
-        del self.current_file
-        self.current_file = None
-        self.max_count    = 0
-        self.frame_count  = 0
-        self.is_acquiring = False
-        self.skip_counter = 0
-        self.skip_limit   = 0
-        self.metadata_file.close()
+    def dataset_finish(self,notify=False):
+        # The dataset is closed once the writer has saved the queued frames
+        with self.state_lock:
+            if not self.is_acquiring:
+                return
+            self.is_acquiring = False
+            self.max_count    = 0
+            self.frame_count  = 0
+            self.skip_counter = 0
+            self.skip_limit   = 0
+            self.write_queue.put_command('finish',(notify,))
+        self._schedule_write()
     
     def save_snap(self,work_dir,filename):
-        if self._cam.frame_buffer.size > 0:
+        if self._cam.frame_seq >= 0:
             self.dataset_start(work_dir,filename)
             self.dataset_push_frame()
             self.dataset_finish()
-            self.saving_progress.emit('')
             
     def start_acquisition(self,work_dir,filename,num_frames,skip_limit=0):
         self.skip_limit = skip_limit
@@ -124,10 +297,9 @@ class ImageToNDTiff(QObject):
             self.saving_progress.emit(f'{self.frame_count}')
         
     def stop_acquisition(self):
-        if self.is_acquiring:
-            self.frame_count = self.max_count # Force to end
+        self.dataset_finish(notify=True)
     
-    def push_frame(self):
+    def push_frame(self,seq=None):
         if self.is_acquiring:
             if self.skip_limit > 0:
                 if (self.skip_counter % self.skip_limit ) != 0:
@@ -135,27 +307,142 @@ class ImageToNDTiff(QObject):
                     return
 
             self.skip_counter += 1
-            self.dataset_push_frame()
+            self.dataset_push_frame(seq)
             if self.dataset_check_done_state():
-                self.dataset_finish()
-                self.saving_progress.emit('')
-                self.finish_saving.emit()
-            else:
-                self.saving_progress.emit(f'{self.frame_count}/{self.max_count}')
+                self.dataset_finish(notify=True)
     
-    @pyqtSlot()
-    def got_frame(self):
+    @pyqtSlot(int)
+    def got_frame(self,seq):
+        # Runs in the camera thread (direct connection): the frame is copied
+        # while its ring slot is still valid, writing happens in write_pending.
         if self.process:
-            self.push_frame()
+            self.push_frame(seq)
+    
+    ########################################################### Writer side
+    
+    @pyqtSlot()
+    def write_pending(self):
+        self._write_scheduled = False
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                break
+            command,args = item
+            if command == 'start':
+                self._open_dataset(*args)
+            elif command == 'frame':
+                self._write_frame(args)
+            elif command == 'finish':
+                self._close_dataset(*args)
+    
+    def _open_dataset(self,work_dir,filename,num_frames,spill_dir):
+        print(f'Starting {filename}')
+        summary_metadata  = {'CameraUniqueId': self._cam.uid,
+                             'CameraVendor':   self._cam.vendor,
+                             'CameraModel':    self._cam.model,
+                             'PixelSizeNM':    self._cam.pix_size_nm,
+                             'HostClockOffsetSec': self._cam.host_clock_offset}
+        makedirs(filename,exist_ok=True)
+        from ndstorage import NDTiffDataset # only needed once saving starts
+        self.current_file  = NDTiffDataset(work_dir,name=filename,summary_metadata=summary_metadata,writable=True)
+        self.metadata_file = open(normpath(join(self.current_file.path,filename))+'.csv','w')
+        self.metadata_file.write('#N_FRAME,HOST_TIME,HW_TIMESTAMP,HW_FRAME_INDEX,X,Y,Z,LASER_INDEX,LASER_ON_NAME,LASER_VALUE,LASER_UNIT,FILTER_WHEEL_POS,FILTER_WHEEL_NAME,STATE_VERSION\n')
+        # HOST_TIME is perf_counter seconds, HOST_TIME + HOST_CLOCK_OFFSET gives epoch seconds
+        self.metadata_file.write(f'# HOST_CLOCK_OFFSET={self._cam.host_clock_offset:.6f}\n')
+        self.metadata_rows = []
+        if self.save_binary_metadata:
+            self.metadata_bin = FrameMetadataWriter(normpath(join(self.current_file.path,filename))+'_meta',self._cam.host_clock_offset)
+        self.spill_dir     = spill_dir
+        self.written_count = 0
+        self.written_max   = num_frames
+    
+    def _write_frame(self,entry):
+        if self.current_file is None:
+            return
+        frame       = entry['frame']
+        frame_count = entry['frame_count']
+        host_time,hw_time,hw_index = entry['stamps']
+        state_version,state = entry['devices']
+        x = state.get('x',0)
+        y = state.get('y',0)
+        z = state.get('z',0)
+        laser_index,laser_name,laser_power,laser_units = state.get('laser',('none',0,0,'none'))
+        fw_pos  = state.get('filter_pos',0)
+        fw_name = state.get('filter_name','none')
+        
+        md_coord = {'x': x, 'y': y, 'z': z, 't': frame_count}
+        md_img = {'host_time':      host_time,
+                  'hw_timestamp':   hw_time if hw_time == hw_time else None,
+                  'hw_frame_index': hw_index,
+                  'frame_count':    frame_count}
+        self.current_file.put_image(md_coord,frame,md_img)
+        self._cam.mark_frame_stage(entry['seq'],'write',acquired=host_time)
+        self.metadata_rows.append(f'{frame_count},{host_time:.6f},{hw_time:.6f},{hw_index},{x},{y},{z},'
+                                  f'{laser_index},{laser_name},{laser_power},{laser_units},{fw_pos},{fw_name},{state_version}\n')
+        if len(self.metadata_rows) >= self.metadata_block:
+            self._flush_metadata()
+        if self.metadata_bin is not None:
+            self.metadata_bin.append(frame_index    = frame_count,
+                                     host_time      = host_time,
+                                     hw_timestamp   = hw_time,
+                                     hw_frame_index = hw_index,
+                                     x = x, y = y, z = z,
+                                     laser_index    = np.nan if isinstance(laser_index,str) else laser_index,
+                                     laser_power    = laser_power,
+                                     filter_pos     = fw_pos,
+                                     state_version  = state_version)
+        
+        self.written_count += 1
+        if self.written_max > 0:
+            self.saving_progress.emit(f'{self.written_count}/{self.written_max}')
+        self._update_rates(frame.nbytes)
+    
+    def _update_rates(self,n_bytes):
+        self._rate_frames += 1
+        self._rate_bytes  += n_bytes
+        elapsed = perf_counter() - self._rate_t0
+        if elapsed >= 1.0:
+            self.write_fps     = self._rate_frames/elapsed
+            self.write_mbps    = self._rate_bytes/elapsed/1e6
+            self._rate_t0      = perf_counter()
+            self._rate_frames  = 0
+            self._rate_bytes   = 0
+    
+    def _flush_metadata(self):
+        self.metadata_file.write(''.join(self.metadata_rows))
+        self.metadata_rows = []
+    
+    def _close_dataset(self,notify):
+        if self.current_file is None:
+            return
+        
+        self.current_file.finish()
+        del self.current_file
+        self.current_file = None
+        self._flush_metadata()
+        self.metadata_file.close()
+        if self.metadata_bin is not None:
+            self.metadata_bin.close()
+            self.metadata_bin = None
+        try:
+            rmdir(self.spill_dir)
+        except OSError:
+            pass # never created or not empty
+        self.saving_progress.emit('')
+        if notify:
+            self.finish_saving.emit()
 
 ############################################################################### Image to QImage helper
 
 class ImageToQImage(QObject):
-    frame_ready = pyqtSignal()
+    frame_ready     = pyqtSignal()
+    histogram_ready = pyqtSignal(object,int,int,int)
+    _process        = pyqtSignal()
     
     def __init__(self,camera_thread):
         super().__init__()
         self.frame_fixed = np.zeros((0,0))
+        self.buffer_disp = np.zeros((0,0),np.uint8)
         self.current_range   = 0
         
         self._cam = camera_thread
@@ -175,32 +462,195 @@ class ImageToQImage(QObject):
         
         self.do_flip   = False
         self.do_rot180 = False
+        
+        # Display decimation: requested from the view scale (GUI thread) and
+        # the one used by the current qimage
+        self.display_binning = 1
+        self.binning         = 1
+        
+        self.seq = -1
+        
+        # uint16 frames are oriented, mapped through the LUT and histogrammed in
+        # a single pass into buffer_disp. The display limits come from the
+        # histogram of the previous frame, the statistics from the current one.
+        self.hist       = np.zeros(65536,np.int64)
+        self.hist_valid = False
+        
+        # The LUT is only rebuilt when limits, gamma or colormap change
+        self.gamma    = 1.0
+        self.colormap = 'gray'
+        self.lut      = None
+        self.lut_key  = None
+        
+        # Manual display limits (lo,hi) override the auto-contrast when set
+        self.manual_limits = None
+        self.d_min = 0
+        self.d_max = 1
+        
+        # Histogram sent to the GUI, decimated to histogram_bins (0: disabled)
+        self.histogram_bins = 0
+        
+        # Latest-frame-wins: the camera thread only records the newest sequence
+        # number, at most one conversion is scheduled and at most one QImage
+        # waits to be painted. Frames replaced meanwhile are counted as coalesced.
+        self.latest_seq       = -1
+        self.coalesced_frames = 0
+        self.min_interval_ms  = 1000/60
+        self._scheduled = False
+        self._in_flight = False
+        self.refresh    = False
+        self.convert_timer = QElapsedTimer()
+        self.convert_timer.start()
+        self._process.connect( self.process_latest )
     
     def set_outlier_range(self,outlier_range):
         self.current_range = outlier_range
     
+    def set_manual_limits(self,limits):
+        self.manual_limits = limits
+        self.refresh_last_frame()
+    
+    def set_histogram_bins(self,n_bins):
+        self.histogram_bins = n_bins
+    
+    def set_gamma(self,gamma):
+        self.gamma = gamma
+    
+    def set_colormap(self,colormap):
+        if colormap in DISPLAY_COLORMAPS:
+            self.colormap = colormap
+        else:
+            print(f'Unknown colormap {colormap}')
+    
+    def set_display_scale(self,scale):
+        # scale: screen pixels per camera pixel, full resolution from 1 on
+        binning = max(1,int(1/scale)) if scale > 0 else 1
+        if binning != self.display_binning:
+            self.display_binning = binning
+            self.refresh_last_frame()
+    
+    def refresh_last_frame(self):
+        # Converts the shown frame again, e.g. while acquisition is stopped
+        if self._cam.is_frame_valid(self.seq):
+            self.refresh = True
+            self.offer_frame(max(self.seq,self.latest_seq))
+    
+    def set_max_fps(self,max_fps):
+        self.min_interval_ms = 1000/max(max_fps,1)
+    
+    @pyqtSlot(int)
+    def offer_frame(self,seq):
+        # Runs in the camera thread (direct connection)
+        self.latest_seq = seq
+        if self._scheduled:
+            self.coalesced_frames += 1
+        else:
+            self._scheduled = True
+            self._process.emit()
+    
+    def pending_count(self):
+        return int(self._scheduled) + int(self._in_flight)
+    
     @pyqtSlot()
-    def got_frame(self):
+    def process_latest(self):
+        if self._in_flight:
+            return # mark_painted schedules it again
+        wait_ms = self.min_interval_ms - self.convert_timer.elapsed()
+        if wait_ms > 0:
+            QTimer.singleShot(int(np.ceil(wait_ms)),self.process_latest)
+            return
+        self._scheduled = False
+        seq = self.latest_seq
+        if seq != self.seq or self.refresh:
+            self.refresh = False
+            self.convert_timer.restart()
+            self.got_frame(seq)
+    
+    @pyqtSlot(int)
+    def got_frame(self,seq):
+        frame = self._cam.get_frame(seq)
+        if frame is None:
+            self._cam.pipeline_stats.count_drop('display')
+            return
+        self.h,self.w = frame.shape
+        self.binning  = self.display_binning
+        if frame.dtype == np.uint16:
+            self.render_u16(frame)
+        else:
+            self.render_generic(frame)
+        if not self._cam.is_frame_valid(seq):
+            self._cam.pipeline_stats.count_drop('display')
+            return
+        self.seq = seq
+        self.update_qimage()
+    
+    def mark_painted(self):
+        # Runs in the GUI thread once the QImage is on screen
+        self._cam.mark_frame_stage(self.seq,'paint')
+        self._in_flight = False
+        if self._scheduled:
+            self._process.emit()
+        
+    def get_orientation(self):
+        if self.do_rot180:
+            return 2
         if self.do_flip:
-            self.frame_fixed = np.float32( self._cam.frame_buffer[::-1,:] )
+            return 1
+        return 0
+    
+    def get_lut(self,v_lo,v_hi):
+        key = (v_lo,v_hi,self.gamma,self.colormap)
+        if key != self.lut_key:
+            self.lut     = build_display_lut(v_lo,v_hi,self.gamma,self.colormap)
+            self.lut_key = key
+        return self.lut
+    
+    def get_display_buffer(self):
+        shape = ( -(-self.h//self.binning), -(-self.w//self.binning) )
+        if self.buffer_disp.shape != shape or self.buffer_disp.dtype != self.lut.dtype:
+            self.buffer_disp = np.zeros(shape,self.lut.dtype)
+        return self.buffer_disp
+    
+    def render_u16(self,frame):
+        if not self.hist_valid:
+            get_histogram_u16(frame,self.hist)
+            self.hist_valid = True
+        if self.manual_limits is None:
+            v_min,v_max,_,_,_ = get_histogram_limits(self.hist,float(self.current_range))
+        else:
+            v_min,v_max = self.manual_limits
+        self.d_min,self.d_max = v_min,v_max
+        lut = self.get_lut(v_min,v_max)
+        render_u16_lut(frame,self.get_display_buffer(),self.hist,self.get_orientation(),lut,self.binning)
+        _,_,self.v_min,self.v_max,self.v_avg = get_histogram_limits(self.hist,float(self.current_range))
+    
+    def render_generic(self,frame):
+        self.hist_valid = False
+        if self.do_flip:
+            self.frame_fixed = np.float32( frame[::-1,:] )
         elif self.do_rot180:
-            self.frame_fixed = np.float32( self._cam.frame_buffer[::-1,::-1] )
+            self.frame_fixed = np.float32( frame[::-1,::-1] )
         else:
-            self.frame_fixed = np.float32( self._cam.frame_buffer )
-        self.update_qimage()
+            self.frame_fixed = np.float32( frame )
         
-    @pyqtSlot()
-    def update_qimage(self):
-        if self.current_range > 0:
+        if self.manual_limits is not None:
+            v_min,v_max = self.manual_limits
+        elif self.current_range > 0:
             v_min,v_max = np.quantile(self.frame_fixed.ravel(),(self.current_range,1-self.current_range))
         else:
             v_min = self.frame_fixed.min()
             v_max = self.frame_fixed.max()
-        
+        v_max = max(v_max,v_min+1)
+        self.d_min,self.d_max = v_min,v_max
         self.v_min,self.v_max,self.v_avg = get_min_max_avg(self.frame_fixed)
         
-        self.h,self.w = self.frame_fixed.shape
+        buffer_f32 = (self.frame_fixed[::self.binning,::self.binning]-v_min) / (v_max-v_min)
+        buffer_u16 = np.uint16( np.round( 65535.0*buffer_f32.clip(0,1) ) )
+        lut = self.get_lut(0,65535)
+        np.take(lut,buffer_u16,out=self.get_display_buffer())
         
+    @pyqtSlot()
+    def update_qimage(self):
         self.v_fps = 0
         
         time_in_ms = self.fps_timer.restart()
@@ -211,12 +661,221 @@ class ImageToQImage(QObject):
         if mean_ms > 0:
             self.v_fps = 1000/mean_ms
         
-        buffer_f32  = (self.frame_fixed-v_min) / (v_max-v_min)
-        buffer_u16  = np.uint16( np.round( 65535.0*buffer_f32.clip(0,1) ) )
-        self.qimage = QImage( buffer_u16.data, self.w, self.h, 2*self.w, QImage.Format.Format_Grayscale16 )
-        # buffer_u16  = np.uint8( np.round( 255.0*buffer_f32.clip(0,1) ) )
-        # self.qimage = QImage( buffer_u16.data, self.w, self.h, self.w, QImage.Format.Format_Grayscale8 )
+        # buffer_disp is only rewritten after mark_painted, once the pixmap got copied
+        h,w = self.buffer_disp.shape
+        if self.buffer_disp.dtype == np.uint8:
+            self.qimage = QImage( self.buffer_disp.data, w, h, w, QImage.Format.Format_Grayscale8 )
+        else:
+            self.qimage = QImage( self.buffer_disp.data, w, h, 4*w, QImage.Format.Format_RGB32 )
+        self._cam.mark_frame_stage(self.seq,'convert')
+        self._in_flight = True
         self.frame_ready.emit()
+        
+        if self.histogram_bins > 0 and self.hist_valid:
+            self.emit_histogram()
+    
+    def emit_histogram(self):
+        # Power of two range covering the frame max, summed down to histogram_bins
+        top  = max( self.histogram_bins, 1 << int(self.v_max).bit_length() )
+        bins = self.hist[:top].reshape(self.histogram_bins,-1).sum(axis=1)
+        self.histogram_ready.emit(bins,top,int(self.d_min),int(self.d_max))
+
+############################################################################### Histogram panel
+
+class HistogramWidget(QWidget):
+    limits_changed = pyqtSignal(int,int)
+    
+    def __init__(self,parent=None):
+        super().__init__(parent)
+        self.bins  = np.zeros(0,np.int64)
+        self.top   = 1
+        self.d_min = 0
+        self.d_max = 1
+        self.log_scale = True
+        self.dragging  = None # 0: lower limit, 1: upper limit
+        self.setMinimumHeight(100)
+        self.setToolTip('Drag the limits to set the contrast, auto-contrast buttons restore it')
+    
+    @pyqtSlot(object,int,int,int)
+    def set_histogram(self,bins,top,d_min,d_max):
+        self.bins = bins
+        self.top  = top
+        if self.dragging is None:
+            self.d_min = d_min
+            self.d_max = d_max
+        self.update()
+    
+    def _value_to_x(self,value):
+        return value*self.width()/self.top
+    
+    def _x_to_value(self,x):
+        return int( round( x*self.top/max(self.width(),1) ) )
+    
+    def paintEvent(self,event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(),QColor('#202020'))
+        W = self.width()
+        H = self.height()
+        
+        if self.bins.size > 0:
+            counts = np.log1p(self.bins) if self.log_scale else np.float64(self.bins)
+            c_max  = counts.max()
+            if c_max > 0:
+                heights = counts*(H-2)/c_max
+                bar_w   = W/self.bins.size
+                painter.setPen(Qt.NoPen)
+                painter.setBrush(QColor('#A0A0A0'))
+                for i,bar_h in enumerate(heights):
+                    painter.drawRect( QRectF(i*bar_w,H-bar_h,bar_w,bar_h) )
+        
+        for value,color in ((self.d_min,'#1E90FF'),(self.d_max,'#FFD700')):
+            x = self._value_to_x(value)
+            painter.setPen(QPen(QColor(color),2))
+            painter.drawLine(QPointF(x,0),QPointF(x,H))
+        
+        painter.setPen(QColor('#E0E0E0'))
+        painter.drawText(self.rect().adjusted(4,2,-4,-2),Qt.AlignRight|Qt.AlignTop,f'[{self.d_min}, {self.d_max}] of {self.top}')
+        painter.end()
+    
+    def mousePressEvent(self,event):
+        if event.button() == Qt.LeftButton:
+            x = event.pos().x()
+            d_lo = abs( x-self._value_to_x(self.d_min) )
+            d_hi = abs( x-self._value_to_x(self.d_max) )
+            self.dragging = 0 if d_lo < d_hi else 1
+            self.mouseMoveEvent(event)
+    
+    def mouseMoveEvent(self,event):
+        if self.dragging is None:
+            return
+        value = min( max( self._x_to_value(event.pos().x()), 0 ), self.top )
+        if self.dragging == 0:
+            self.d_min = min(value,self.d_max-1)
+        else:
+            self.d_max = max(value,self.d_min+1)
+        self.limits_changed.emit(self.d_min,self.d_max)
+        self.update()
+    
+    def mouseReleaseEvent(self,event):
+        self.dragging = None
+
+############################################################################### Analysis ROI traces
+
+ANALYSIS_COLORS = ('#00FFFF','#FF00FF','#7FFF00','#FF8C00','#1E90FF','#FF4500')
+TRACE_STATS     = ('mean','sum','max')
+
+class ImageToTraces(QObject):
+    _process = pyqtSignal()
+    
+    def __init__(self,camera_thread,qimg_provider,n_samples=1000):
+        super().__init__()
+        self._cam  = camera_thread
+        self._qimg = qimg_provider
+        self.n_samples = n_samples
+        self.lock = Lock()
+        self.set_boxes( np.zeros((0,4),np.int32) )
+        
+        # Latest-frame-wins, as ImageToQImage: frames arriving while a sample
+        # is pending are skipped and counted as coalesced.
+        self.latest_seq       = -1
+        self.coalesced_frames = 0
+        self._scheduled = False
+        self._process.connect( self.process_latest )
+    
+    def set_boxes(self,boxes):
+        # boxes: (n,4) x0,y0,x1,y1 in displayed (oriented) camera pixels
+        with self.lock:
+            self.boxes     = np.int32(boxes).reshape(-1,4)
+            self.stats     = np.zeros((self.boxes.shape[0],len(TRACE_STATS)))
+            self.traces    = np.full((len(TRACE_STATS),self.boxes.shape[0],self.n_samples),np.nan)
+            self.times     = np.full(self.n_samples,np.nan)
+            self.new_index = 0
+    
+    def _frame_boxes(self,n_rows,n_cols):
+        # Map the displayed boxes back to raw frame coordinates
+        boxes = self.boxes.copy()
+        boxes[:,0::2] = boxes[:,0::2].clip(0,n_cols)
+        boxes[:,1::2] = boxes[:,1::2].clip(0,n_rows)
+        orientation = self._qimg.get_orientation()
+        if orientation > 0:
+            boxes[:,[1,3]] = n_rows-boxes[:,[3,1]]
+        if orientation == 2:
+            boxes[:,[0,2]] = n_cols-boxes[:,[2,0]]
+        return boxes
+    
+    @pyqtSlot(int)
+    def offer_frame(self,seq):
+        # Runs in the camera thread (direct connection)
+        if self.boxes.shape[0] == 0:
+            return
+        self.latest_seq = seq
+        if self._scheduled:
+            self.coalesced_frames += 1
+        else:
+            self._scheduled = True
+            self._process.emit()
+    
+    @pyqtSlot()
+    def process_latest(self):
+        self._scheduled = False
+        self.got_frame(self.latest_seq)
+    
+    def got_frame(self,seq):
+        if self.boxes.shape[0] == 0:
+            return
+        frame = self._cam.get_frame(seq)
+        if frame is None:
+            return
+        with self.lock:
+            get_boxes_stats(frame,self._frame_boxes(*frame.shape),self.stats)
+            if not self._cam.is_frame_valid(seq):
+                return
+            host_time,_,_ = self._cam.get_frame_stamps(seq)
+            self.traces[:,:,self.new_index] = self.stats.T
+            self.times[self.new_index]      = host_time
+            self.new_index = ( self.new_index + 1 ) % self.n_samples
+    
+    def get_traces(self,stat):
+        # Oldest to newest copy of one statistic: times (n_samples), traces (n_boxes,n_samples)
+        with self.lock:
+            order = np.roll(np.arange(self.n_samples),-self.new_index)
+            return self.times[order],self.traces[TRACE_STATS.index(stat)][:,order]
+
+class TracesWidget(QWidget):
+    
+    def __init__(self,parent=None):
+        super().__init__(parent)
+        self.traces = np.zeros((0,0))
+        self.setMinimumHeight(120)
+    
+    def set_traces(self,traces):
+        self.traces = traces
+        self.update()
+    
+    def paintEvent(self,event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(),QColor('#202020'))
+        W = self.width()
+        H = self.height()
+        
+        valid = np.isfinite(self.traces)
+        if valid.any():
+            v_min = self.traces[valid].min()
+            v_max = self.traces[valid].max()
+            v_rng = max(v_max-v_min,1e-9)
+            n_samples = self.traces.shape[1]
+            x_step = W/max(n_samples-1,1)
+            for k,trace in enumerate(self.traces):
+                points = [ QPointF( i*x_step, (H-4)*(1-(val-v_min)/v_rng)+2 ) for i,val in enumerate(trace) if val == val ]
+                if len(points) > 1:
+                    pen = QPen(QColor(ANALYSIS_COLORS[k%len(ANALYSIS_COLORS)]),1)
+                    painter.setPen(pen)
+                    painter.drawPolyline(QPolygonF(points))
+            
+            painter.setPen(QColor('#E0E0E0'))
+            painter.drawText(self.rect().adjusted(4,2,-4,-2),Qt.AlignLeft|Qt.AlignTop   ,f'{v_max:.1f}')
+            painter.drawText(self.rect().adjusted(4,2,-4,-2),Qt.AlignLeft|Qt.AlignBottom,f'{v_min:.1f}')
+        painter.end()
 
 ############################################################################### Custom GraphicsScene
 
@@ -274,10 +933,12 @@ class CameraScene(QGraphicsScene):
         self.moving_roi.setZValue(0)
         self.addItem(self.moving_roi)
         
+        self.analysis_boxes = []
+        
     def has_image(self):
         return self.image is not None
         
-    def set_frame(self,qimg:QImage):
+    def set_frame(self,qimg:QImage,binning=1):
         should_fit = False
         if self.image is None:
             self.image = QGraphicsPixmapItem()
@@ -288,9 +949,11 @@ class CameraScene(QGraphicsScene):
             self.image.setTransformationMode( Qt.TransformationMode.FastTransformation )
             should_fit = True
             
+        # Decimated images are scaled back, scene coordinates stay camera pixels
         pixmap = QPixmap.fromImage(qimg)
         self.image.setPixmap(pixmap)
-        self.setSceneRect( self.image.boundingRect())
+        self.image.setScale(binning)
+        self.setSceneRect( self.image.sceneBoundingRect() )
         self.W = self.sceneRect().width()
         self.H = self.sceneRect().height()
         
@@ -311,6 +974,22 @@ class CameraScene(QGraphicsScene):
     
     def hide_moving_roi(self):
         self.moving_roi.setVisible(False)
+    
+    def add_analysis_box(self,pos:QPointF):
+        color = ANALYSIS_COLORS[len(self.analysis_boxes)%len(ANALYSIS_COLORS)]
+        pen = QPen(QColor(color),2)
+        pen.setCosmetic(True)
+        box = QGraphicsRectItem(QRectF(pos,pos))
+        box.setPen(pen)
+        box.setZValue(0)
+        self.addItem(box)
+        self.analysis_boxes.append(box)
+        return box
+    
+    def clear_analysis_boxes(self):
+        for box in self.analysis_boxes:
+            self.removeItem(box)
+        self.analysis_boxes = []
         
     def try_move_moving_roi(self,new_pos:QPointF):
         x = new_pos.x()
@@ -333,6 +1012,7 @@ class CameraViewer(QGraphicsView):
     new_position = pyqtSignal(int,int)
     set_roi_up   = pyqtSignal()
     set_roi_down = pyqtSignal()
+    analysis_box_added = pyqtSignal(int,int,int,int)
     
     def __init__(self, qimg_provider, parent=None, useOpenGL=True, background='#202020'):
         
@@ -344,6 +1024,10 @@ class CameraViewer(QGraphicsView):
         
         self.track_roi = False
         
+        self.draw_box  = False
+        self.box_start = None
+        self.box_item  = None
+        
         if useOpenGL:
             self.setViewport( QOpenGLWidget() )
         
@@ -364,8 +1048,9 @@ class CameraViewer(QGraphicsView):
     
     @pyqtSlot()
     def got_frame(self):
-        if self.scene_handler.set_frame(self._qimg_provider.qimage):
+        if self.scene_handler.set_frame(self._qimg_provider.qimage,self._qimg_provider.binning):
             self.fitScale()
+        self._qimg_provider.mark_painted()
     
     @pyqtSlot()
     def fitScale(self):
@@ -377,11 +1062,16 @@ class CameraViewer(QGraphicsView):
             scale = min(scale_x,scale_y)
             self.scale(scale,scale)
             self.centerOn(self.scene_handler.Wh,self.scene_handler.Hh)
+            self.update_display_scale()
     
     def resetScale(self):
         if self.scene_handler.has_main_image():
             self.setTransform( QTransform.fromScale(1,1) )
             self.centerOn(self.scene_handler.Wh,self.scene_handler.Hh)
+            self.update_display_scale()
+    
+    def update_display_scale(self):
+        self._qimg_provider.set_display_scale( self.transform().m11() )
     
     def mousePressEvent(self,event):
         super().mousePressEvent(event)
@@ -390,7 +1080,11 @@ class CameraViewer(QGraphicsView):
             self.do_pan = True
             self.start_pos = event.pos()
         
-        if event.button() == Qt.LeftButton:
+        if event.button() == Qt.LeftButton and self.draw_box:
+            self.box_start = self.mapToScene(event.pos())
+            self.box_item  = self.scene_handler.add_analysis_box(self.box_start)
+        
+        elif event.button() == Qt.LeftButton:
             if self.track_roi:
                 x = int( self.scene_handler.moving_roi.pos().x() )
                 y = int( self.scene_handler.moving_roi.pos().y() )
@@ -401,6 +1095,19 @@ class CameraViewer(QGraphicsView):
         
         if event.button() in  (Qt.MiddleButton,Qt.RightButton):
             self.do_pan = False
+        
+        if event.button() == Qt.LeftButton and self.box_item is not None:
+            rect = self.box_item.rect()
+            x0 = int( round( rect.left()   ) )
+            y0 = int( round( rect.top()    ) )
+            x1 = int( round( rect.right()  ) )
+            y1 = int( round( rect.bottom() ) )
+            if x1 > x0 and y1 > y0:
+                self.analysis_box_added.emit(x0,y0,x1,y1)
+            else:
+                self.scene_handler.analysis_boxes.remove(self.box_item)
+                self.scene_handler.removeItem(self.box_item)
+            self.box_item = None
     
     def mouseMoveEvent(self,event):
         if self.do_pan:
@@ -414,6 +1121,10 @@ class CameraViewer(QGraphicsView):
         if self.track_roi:
             scene_pos = self.mapToScene(event.pos())
             self.scene_handler.try_move_moving_roi(scene_pos)
+        
+        if self.box_item is not None:
+            scene_pos = self.mapToScene(event.pos())
+            self.box_item.setRect( QRectF(self.box_start,scene_pos).normalized() )
             
         super().mouseMoveEvent(event)
         
@@ -445,11 +1156,13 @@ class CameraViewer(QGraphicsView):
     def zoom_in(self):
         factor = 1.25
         self.scale(factor,factor)
+        self.update_display_scale()
     
     @pyqtSlot()
     def zoom_out(self):
         factor = 0.8
         self.scale(factor,factor)
+        self.update_display_scale()
         
     def show_current_roi(self,x,y,box_size):
         self.scene_handler.show_current_roi(x,y,box_size)
@@ -466,6 +1179,12 @@ class CameraViewer(QGraphicsView):
         self.scene_handler.hide_current_roi()
         self.scene_handler.hide_moving_roi()
         self.track_roi = False
+    
+    def set_box_drawing(self,enabled):
+        self.draw_box = enabled
+    
+    def clear_analysis_boxes(self):
+        self.scene_handler.clear_analysis_boxes()
 
 ############################################################################### Camera Viewer
 
@@ -489,6 +1208,9 @@ class CameraWidget(QWidget):
         
         self.img2qimg    = ImageToQImage(self.cam_handler)
         self.img2qimg.set_outlier_range(0.002)
+        screen = QGuiApplication.primaryScreen()
+        if screen is not None:
+            self.img2qimg.set_max_fps(screen.refreshRate())
         self.img2qimg_th = QThread(self)
         self.img2qimg.moveToThread(self.img2qimg_th)
         
@@ -496,25 +1218,42 @@ class CameraWidget(QWidget):
         self.img2tiff_th = QThread(self)
         self.img2tiff.moveToThread(self.img2tiff_th)
         
+        self.img2traces    = ImageToTraces(self.cam_handler,self.img2qimg)
+        self.img2traces_th = QThread(self)
+        self.img2traces.moveToThread(self.img2traces_th)
+        self.analysis_boxes = []
+        
         self.image = CameraViewer(self.img2qimg)
         
         self.upper_bar = self.create_upper_bar(camera_name)
         
+        self.stats_panel = self.create_stats_panel()
+        
+        self.histogram = HistogramWidget()
+        self.histogram.setVisible(False)
+        
+        self.traces_panel = self.create_traces_panel()
+        
         self.lower_panel = self.create_lower_panel()                
                    
         layout = QVBoxLayout()
         layout.addWidget(self.upper_bar  , stretch=0)
+        layout.addWidget(self.stats_panel, stretch=0)
+        layout.addWidget(self.histogram  , stretch=0)
+        layout.addWidget(self.traces_panel, stretch=0)
         layout.addWidget(self.image      , stretch=1)
         layout.addWidget(self.lower_panel, stretch=0)
         self.setLayout(layout)
         
         self.cam_handler.roi_set.connect( self.update_roi_state )
-        self.cam_handler.frame_ready.connect(self.img2qimg.got_frame)
-        self.cam_handler.frame_ready.connect(self.img2tiff.got_frame)
+        self.cam_handler.frame_ready.connect(self.img2qimg.offer_frame,Qt.DirectConnection)
+        self.cam_handler.frame_ready.connect(self.img2tiff.got_frame,Qt.DirectConnection)
+        self.cam_handler.frame_ready.connect(self.img2traces.offer_frame,Qt.DirectConnection)
         
         self.image.new_position.connect( self.got_new_roi_position )
         self.image.set_roi_up  .connect( self.roi_up   )
         self.image.set_roi_down.connect( self.roi_down )
+        self.image.analysis_box_added.connect( self.add_analysis_box )
         
         self.start_acquiring.connect(self.cam_handler.acquire_frames)
         
@@ -522,12 +1261,15 @@ class CameraWidget(QWidget):
         self.roi_new_siz.connect( self.image.roi_new_siz )
         
         self.img2qimg.frame_ready.connect( self.update_image )
+        self.img2qimg.histogram_ready.connect( self.histogram.set_histogram )
+        self.histogram.limits_changed.connect( self.update_manual_contrast )
         self.img2tiff.finish_saving.connect( self.saving_finished )
         self.img2tiff.saving_progress.connect(lambda msg: self.frames.setText(msg))
         
         self.cam_thread.start()
         self.img2qimg_th.start()
         self.img2tiff_th.start()
+        self.img2traces_th.start()
     
     def create_upper_bar(self,camera_name):
         widget = QWidget()
@@ -543,13 +1285,23 @@ class CameraWidget(QWidget):
         btn_zoom_in   = create_iconized_button(_g_icon_prov.zoom_in ,tooltip='Zoom in')
         btn_zoom_out  = create_iconized_button(_g_icon_prov.zoom_out,tooltip='Zoom out')
         
+        btn_stats     = create_iconized_button(_g_icon_prov.settings,tooltip='Pipeline statistics')
+        btn_histogram = create_iconized_button(_g_icon_prov.dimmer_switch,tooltip='Histogram')
+        btn_traces    = create_iconized_button(_g_icon_prov.continuous_wave,tooltip='Analysis ROI traces')
+        
         btn_zoom_full.clicked.connect(self.image.fitScale)
         btn_zoom_in  .clicked.connect(self.image.zoom_in)
         btn_zoom_out .clicked.connect(self.image.zoom_out)
+        btn_stats    .clicked.connect(self.toggle_stats_panel)
+        btn_histogram.clicked.connect(self.toggle_histogram)
+        btn_traces   .clicked.connect(self.toggle_traces_panel)
         
         stat_layout.addWidget(btn_zoom_full)
         stat_layout.addWidget(btn_zoom_in  )
         stat_layout.addWidget(btn_zoom_out )
+        stat_layout.addWidget(btn_stats    )
+        stat_layout.addWidget(btn_histogram)
+        stat_layout.addWidget(btn_traces   )
         
         stat_layout.addStretch()
 
@@ -603,6 +1355,147 @@ class CameraWidget(QWidget):
         
         return widget
 
+    def create_stats_panel(self):
+        widget = StyledFrame()
+        layout = QGridLayout()
+        layout.setContentsMargins(3,3,3,3)
+        
+        font = QFont()
+        font.setBold(True)
+        
+        for col,text in enumerate(['Latency (ms)','Mean','P50','P95','Max','Frames']):
+            label = QLabel(text)
+            label.setFont(font)
+            layout.addWidget(label,0,col)
+        
+        self.stats_labels = {}
+        for row,stage in enumerate(FRAME_STAGES,start=1):
+            label = QLabel(stage.capitalize())
+            label.setFont(font)
+            layout.addWidget(label,row,0)
+            self.stats_labels[stage] = [QLabel('-') for _ in range(5)]
+            for col,value_label in enumerate(self.stats_labels[stage],start=1):
+                layout.addWidget(value_label,row,col)
+        
+        label = QLabel('Dropped')
+        label.setFont(font)
+        self.stats_drops = QLabel('-')
+        layout.addWidget(label,len(FRAME_STAGES)+1,0)
+        layout.addWidget(self.stats_drops,len(FRAME_STAGES)+1,1,1,5)
+        
+        label = QLabel('Queues')
+        label.setFont(font)
+        self.stats_queues = QLabel('-')
+        layout.addWidget(label,len(FRAME_STAGES)+2,0)
+        layout.addWidget(self.stats_queues,len(FRAME_STAGES)+2,1,1,5)
+        
+        widget.setLayout(layout)
+        widget.setVisible(False)
+        
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats_panel)
+        
+        return widget
+    
+    @pyqtSlot()
+    def toggle_stats_panel(self):
+        if self.stats_panel.isVisible():
+            self.stats_timer.stop()
+            self.stats_panel.setVisible(False)
+        else:
+            self.update_stats_panel()
+            self.stats_panel.setVisible(True)
+            self.stats_timer.start(1000)
+    
+    def create_traces_panel(self):
+        widget = StyledFrame()
+        layout = QVBoxLayout()
+        layout.setContentsMargins(3,3,3,3)
+        
+        controls_widget = QWidget()
+        controls_layout = QHBoxLayout()
+        controls_layout.setContentsMargins(0,0,0,0)
+        
+        self.traces_draw  = QPushButton('Draw boxes')
+        self.traces_draw.setCheckable(True)
+        self.traces_clear = QPushButton('Clear')
+        self.traces_stat  = create_combo_box(list(TRACE_STATS),'mean')
+        
+        self.traces_draw .toggled.connect(self.image.set_box_drawing)
+        self.traces_clear.clicked.connect(self.clear_analysis_boxes)
+        self.traces_stat .currentIndexChanged.connect(self.update_traces_panel)
+        
+        controls_layout.addWidget(self.traces_draw )
+        controls_layout.addWidget(self.traces_clear)
+        controls_layout.addStretch()
+        controls_layout.addWidget(QLabel('Trace:'))
+        controls_layout.addWidget(self.traces_stat )
+        controls_widget.setLayout(controls_layout)
+        
+        self.traces_plot = TracesWidget()
+        
+        layout.addWidget(controls_widget)
+        layout.addWidget(self.traces_plot)
+        
+        widget.setLayout(layout)
+        widget.setVisible(False)
+        
+        self.traces_timer = QTimer(self)
+        self.traces_timer.timeout.connect(self.update_traces_panel)
+        
+        return widget
+    
+    @pyqtSlot()
+    def toggle_traces_panel(self):
+        if self.traces_panel.isVisible():
+            self.traces_timer.stop()
+            self.traces_draw.setChecked(False)
+            self.traces_panel.setVisible(False)
+        else:
+            self.update_traces_panel()
+            self.traces_panel.setVisible(True)
+            self.traces_timer.start(100)
+    
+    @pyqtSlot()
+    def update_traces_panel(self):
+        _,traces = self.img2traces.get_traces(self.traces_stat.currentData())
+        self.traces_plot.set_traces(traces)
+    
+    @pyqtSlot(int,int,int,int)
+    def add_analysis_box(self,x0,y0,x1,y1):
+        self.analysis_boxes.append((x0,y0,x1,y1))
+        self.img2traces.set_boxes(np.array(self.analysis_boxes))
+    
+    @pyqtSlot()
+    def clear_analysis_boxes(self):
+        self.analysis_boxes = []
+        self.image.clear_analysis_boxes()
+        self.img2traces.set_boxes(np.zeros((0,4),np.int32))
+    
+    @pyqtSlot()
+    def toggle_histogram(self):
+        if self.histogram.isVisible():
+            self.img2qimg.set_histogram_bins(0)
+            self.histogram.setVisible(False)
+        else:
+            self.img2qimg.set_histogram_bins(256)
+            self.histogram.setVisible(True)
+    
+    @pyqtSlot()
+    def update_stats_panel(self):
+        stats   = self.cam_handler.pipeline_stats
+        summary = stats.summary()
+        for stage in FRAME_STAGES:
+            entry = summary[stage]
+            if entry is None:
+                texts = ['-']*5
+            else:
+                texts = [f"{entry['mean']:.2f}",f"{entry['p50']:.2f}",f"{entry['p95']:.2f}",f"{entry['max']:.2f}",f"{entry['frames']}"]
+            for label,text in zip(self.stats_labels[stage],texts):
+                label.setText(text)
+        self.stats_drops.setText(f"camera: {self.cam_handler.dropped_frames}, display: {stats.drops['display']}, disk: {stats.drops['disk']}")
+        self.stats_queues.setText(f"display coalesced: {self.img2qimg.coalesced_frames}, pending: {self.img2qimg.pending_count()} | traces coalesced: {self.img2traces.coalesced_frames} | save depth: {self.img2tiff.write_queue.depth()} (max {self.img2tiff.write_queue.max_depth}), dropped: {self.img2tiff.write_queue.n_dropped}, spilled: {self.img2tiff.write_queue.n_spilled}, {self.img2tiff.write_fps:.0f} fps, {self.img2tiff.write_mbps:.0f} MB/s")
+    
     def create_lower_panel(self):
         
         widget = QWidget()
@@ -670,6 +1563,18 @@ class CameraWidget(QWidget):
         input_layout.addWidget(self.skip_frames,2,1)
         input_layout.addWidget(self.est_frame_time,2,2)
         
+        self.queue_policy = create_combo_box(list(SAVE_QUEUE_POLICIES),self.img2tiff.write_queue.policy)
+        self.queue_policy.setToolTip('What to do with new frames when the write queue is full')
+        self.queue_policy.currentIndexChanged.connect(lambda _: self.img2tiff.set_queue_policy(self.queue_policy.currentData()))
+        input_layout.addWidget(QLabel('When queue is full:'),3,0)
+        input_layout.addWidget(self.queue_policy,3,1)
+        
+        self.binary_metadata = QCheckBox('Binary metadata')
+        self.binary_metadata.setToolTip('Also save per-frame metadata as memory-mappable columns')
+        self.binary_metadata.setChecked(self.img2tiff.save_binary_metadata)
+        self.binary_metadata.toggled.connect(lambda checked: setattr(self.img2tiff,'save_binary_metadata',checked))
+        input_layout.addWidget(self.binary_metadata,3,2)
+        
         input_widget.setLayout(input_layout)
         
         layout.addWidget(buttons_widget)
@@ -757,12 +1662,31 @@ class CameraWidget(QWidget):
         roi_contrast_layout.addWidget(self.contrast_value)
         roi_contrast_widget.setLayout(roi_contrast_layout)
         
+        ######## Display mapping
+        
+        display_map_widget = QWidget()
+        display_map_layout = QHBoxLayout()
+        display_map_layout.setContentsMargins(0,0,0,0)
+        
+        self.colormap_value = create_combo_box(list(DISPLAY_COLORMAPS.keys()),self.img2qimg.colormap)
+        self.colormap_value.currentIndexChanged.connect(self.update_display_mapping)
+        self.gamma_value = create_doublespinbox(0.1,5.0,self.img2qimg.gamma,0.1)
+        self.gamma_value.editingFinished.connect(self.update_display_mapping)
+        
+        display_map_layout.addWidget(QLabel('Colormap:'))
+        display_map_layout.addWidget(self.colormap_value)
+        display_map_layout.addStretch()
+        display_map_layout.addWidget(QLabel('Gamma:'))
+        display_map_layout.addWidget(self.gamma_value)
+        display_map_widget.setLayout(display_map_layout)
+        
         ######## ROI update Fields and Buttons
         self.update_roi_state()
         
         layout.addWidget(roi_button_widget)
         layout.addWidget(roi_config_widget)
         layout.addWidget(roi_contrast_widget)
+        layout.addWidget(display_map_widget)
         
         widget.setLayout(layout)
         return widget
@@ -966,7 +1890,18 @@ class CameraWidget(QWidget):
     def update_contrast(self):
         value = self.contrast_value.value()
         self.img2qimg.current_range = value/100
+        self.img2qimg.set_manual_limits(None)
+    
+    @pyqtSlot(int,int)
+    def update_manual_contrast(self,v_min,v_max):
+        self.img2qimg.set_manual_limits((v_min,v_max))
         
+    @pyqtSlot()
+    def update_display_mapping(self):
+        self.img2qimg.set_colormap(self.colormap_value.currentData())
+        self.img2qimg.set_gamma(self.gamma_value.value())
+        self.img2qimg.refresh_last_frame()
+    
     def _scale_contrast_value(self,ratio):
         value = self.contrast_value.value()
         value = round( value/ratio, 2 )
@@ -1044,11 +1979,16 @@ class CameraWidget(QWidget):
         if self.img2tiff_th and self.img2tiff_th.isRunning():
             self.img2tiff_th.quit()
             self.img2tiff_th.wait()  # Ensure thread stops before deleting
+        self.img2tiff.write_queue.close()
         
         if self.img2qimg_th and self.img2qimg_th.isRunning():
             self.img2qimg_th.quit()
             self.img2qimg_th.wait()  # Ensure thread stops before deleting
         
+        if self.img2traces_th and self.img2traces_th.isRunning():
+            self.img2traces_th.quit()
+            self.img2traces_th.wait()  # Ensure thread stops before deleting
+        
         if self.cam_thread and self.cam_thread.isRunning():
             self.cam_thread.quit()
             self.cam_thread.wait()  # Ensure thread stops before deleting
@@ -6,10 +6,8 @@ from PyQt5.QtWidgets import QPushButton, QLabel, QLineEdit, QSpinBox, QComboBox,
 from PyQt5.QtWidgets import QSizePolicy, QFrame
 from PyQt5.QtGui import QImage, QPixmap, QIcon, QFont, QPalette, QColor, QTransform
 from PyQt5.QtGui import QFontMetrics, QIntValidator, QPainter, QPen, QBrush, QColor
-from PyQt5.QtChart import QChart, QChartView, QLineSeries, QValueAxis
 import numpy as np
 from core.utils import FixedSizeNumpyQueue,get_min_max_avg
-from ndstorage import NDTiffDataset
 from gui.ui_utils import IconProvider,ToogleButton,LogDoubleSpinBox
 from gui.ui_utils import create_iconized_button,update_iconized_button
 from gui.ui_utils import create_int_line_edit,create_combo_box,create_spinbox,create_doublespinbox
@@ -80,6 +78,44 @@ class ZLockWidget(QWidget):
         self.data_flt = []
         self.max_points = 100
         
+        # The chart is built once the widget is on screen, QtChart is slow to import
+        self.chart      = None
+        self.line_coarse_up  = None
+        self.line_coarse_low = None
+        self.line_fine_up    = None
+        self.line_fine_low   = None
+        self.chart_area = QVBoxLayout()
+        self.chart_area.setContentsMargins(0,0,0,0)
+        
+        self.layout().addWidget(z_lock_button,0)
+        self.layout().addWidget(conf_widget,0)
+        self.layout().addLayout(self.chart_area,1)
+        
+        self.fine_check.toggled.connect( self.fine_checked )
+        self.kalman_signal.valueChanged.connect( self.set_kalman_signal )
+        self.kalman_noise .valueChanged.connect( self.set_kalman_noise  )
+        self.coarse_low   .valueChanged.connect( self.set_coarse_low    )
+        self.coarse_up    .valueChanged.connect( self.set_coarse_up     )
+        self.fine_low     .valueChanged.connect( self.set_fine_low      )
+        self.fine_up      .valueChanged.connect( self.set_fine_up       )
+        
+        self.fine_low.setEnabled( self.fine_check.checkState() )
+        self.fine_up .setEnabled( self.fine_check.checkState() )
+        
+        self._zlock_handler.error_reporting.connect(self.report_message)
+        self._zlock_handler.ratios_broadcast.connect(self.got_data)
+        
+        
+    def showEvent(self,event):
+        super().showEvent(event)
+        if self.chart is None:
+            QTimer.singleShot(100,self._create_chart) # after the main window is painted
+    
+    def _create_chart(self):
+        if self.chart is not None:
+            return
+        from PyQt5.QtChart import QChart, QChartView, QLineSeries, QValueAxis
+        
         self.series_raw = QLineSeries()
         pen = self.series_raw.pen()
         pen.setColor(Qt.gray)            # RAW line color
@@ -101,8 +137,7 @@ class ZLockWidget(QWidget):
         self.base_line.setPen(pen)
         
         self.line_coarse_up = QLineSeries()
-        self.line_coarse_up.append(0,1.5)
-        self.line_coarse_up.append(self.max_points,1.5)
+        self._update_line(self.line_coarse_up,self.coarse_up.value())
         pen = self.line_coarse_up.pen()
         pen.setColor(self.color_line_coarse)
         pen.setStyle(Qt.DashLine)
@@ -110,8 +145,7 @@ class ZLockWidget(QWidget):
         self.line_coarse_up.setPen(pen)
         
         self.line_coarse_low = QLineSeries()
-        self.line_coarse_low.append(0,0.5)
-        self.line_coarse_low.append(self.max_points,0.5)
+        self._update_line(self.line_coarse_low,self.coarse_low.value())
         pen = self.line_coarse_low.pen()
         pen.setColor(self.color_line_coarse)
         pen.setStyle(Qt.DashLine)
@@ -119,8 +153,7 @@ class ZLockWidget(QWidget):
         self.line_coarse_low.setPen(pen)
         
         self.line_fine_up = QLineSeries()
-        self.line_fine_up.append(0,1.2)
-        self.line_fine_up.append(self.max_points,1.2)
+        self._update_line(self.line_fine_up,self.fine_up.value())
         pen = self.line_fine_up.pen()
         pen.setColor(self.color_line_fine)
         pen.setStyle(Qt.DotLine)
@@ -128,8 +161,7 @@ class ZLockWidget(QWidget):
         self.line_fine_up.setPen(pen)
         
         self.line_fine_low = QLineSeries()
-        self.line_fine_low.append(0,0.8)
-        self.line_fine_low.append(self.max_points,0.8)
+        self._update_line(self.line_fine_low,self.fine_low.value())
         pen = self.line_fine_low.pen()
         pen.setColor(self.color_line_fine)
         pen.setStyle(Qt.DotLine)
@@ -180,34 +212,22 @@ class ZLockWidget(QWidget):
 
         self.chart_view = QChartView(self.chart)
         self.chart_view.setRenderHint(QPainter.Antialiasing)
-                
-        self.layout().addWidget(z_lock_button,0)
-        self.layout().addWidget(conf_widget,0)
-        self.layout().addWidget(self.chart_view,1)
-        
-        self.fine_check.toggled.connect( self.fine_checked )
-        self.kalman_signal.valueChanged.connect( self.set_kalman_signal )
-        self.kalman_noise .valueChanged.connect( self.set_kalman_noise  )
-        self.coarse_low   .valueChanged.connect( self.set_coarse_low    )
-        self.coarse_up    .valueChanged.connect( self.set_coarse_up     )
-        self.fine_low     .valueChanged.connect( self.set_fine_low      )
-        self.fine_up      .valueChanged.connect( self.set_fine_up       )
-        
-        self.fine_low.setEnabled( self.fine_check.checkState() )
-        self.fine_up .setEnabled( self.fine_check.checkState() )
-        self.line_fine_low.setVisible(self.fine_check.checkState())
-        self.line_fine_up.setVisible( self.fine_check.checkState())
-        
-        self._zlock_handler.error_reporting.connect(self.report_message)
-        self._zlock_handler.ratios_broadcast.connect(self.got_data)
-        
+        self.chart_area.addWidget(self.chart_view)
         
+        self.line_fine_low.setVisible(self.fine_check.isChecked())
+        self.line_fine_up.setVisible( self.fine_check.isChecked())
+        self.update_y_range()
+    
     def _update_line(self,line,val):
+        if line is None:
+            return
         line.clear()
         line.append(0,val)
         line.append(self.max_points,val)
 
     def update_y_range(self):
+        if self.chart is None:
+            return
         lo_value = 0
         if len(self.data_flt)>0:
             lo_value = min(np.array(self.data_flt).min(),self.coarse_min)
@@ -226,8 +246,9 @@ class ZLockWidget(QWidget):
             self._zlock_handler.start()
             self.data_raw.clear()
             self.data_flt.clear()
-            self.series_raw.clear()
-            self.series_flt.clear()
+            if self.chart is not None:
+                self.series_raw.clear()
+                self.series_flt.clear()
         else:
             self._zlock_handler.stop()
             
@@ -236,8 +257,9 @@ class ZLockWidget(QWidget):
     def fine_checked(self,state):
         self.fine_low.setEnabled(state)
         self.fine_up.setEnabled(state)
-        self.line_fine_low.setVisible(state)
-        self.line_fine_up.setVisible(state)
+        if self.chart is not None:
+            self.line_fine_low.setVisible(state)
+            self.line_fine_up.setVisible(state)
         self._zlock_handler.should_fine = state
     
     @pyqtSlot(float)
@@ -281,7 +303,8 @@ class ZLockWidget(QWidget):
         self.data_flt.append(filtered)
         if len(self.data_flt) > self.max_points:
             self.data_flt.pop(0)
-    
+        
+        self._create_chart()
         self.series_raw.clear()
         for i, val in enumerate(self.data_raw):
             self.series_raw.append(i, val)
@@ -8,7 +8,6 @@ from PyQt5.QtGui import QImage, QPixmap, QIcon, QFont, QPalette, QColor, QTransf
 from PyQt5.QtGui import QFontMetrics, QIntValidator, QPainter, QPen, QBrush, QColor
 import numpy as np
 from core.utils import FixedSizeNumpyQueue,get_min_max_avg
-from ndstorage import NDTiffDataset
 from gui.ui_utils import IconProvider
 from gui.ui_utils import create_iconized_button,update_iconized_button
 from gui.ui_utils import create_int_line_edit,create_combo_box,create_spinbox,create_doublespinbox
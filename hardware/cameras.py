@@ -1,8 +1,132 @@
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 from PyQt5.QtCore import QRect
-from datetime import datetime
+from time import perf_counter, time
+from threading import Lock
 import numpy as np
 
+############################################################################### Pipeline statistics
+
+# Stages a frame goes through, each one stamps the frame with perf_counter().
+# 'acquire' is the time spent filling the ring slot, the other stages are
+# measured from the acquire stamp of the frame.
+FRAME_STAGES = ('acquire','emit','convert','paint','write')
+
+class PipelineStats():
+    
+    def __init__(self,n_samples=500):
+        self.n_samples = n_samples
+        self.clear()
+        
+    def clear(self):
+        # One writer per stage (its own thread), so no locking is needed
+        self.latency_ms = np.full((len(FRAME_STAGES),self.n_samples),np.nan)
+        self.n_frames   = np.zeros(len(FRAME_STAGES),np.int64)
+        self.drops      = {'display':0,'disk':0}
+        
+    def push(self,stage_index,latency_ms):
+        n = self.n_frames[stage_index]
+        self.latency_ms[stage_index,n % self.n_samples] = latency_ms
+        self.n_frames[stage_index] = n + 1
+        
+    def count_drop(self,consumer,n=1):
+        self.drops[consumer] = self.drops.get(consumer,0) + n
+        
+    def samples(self,stage):
+        values = self.latency_ms[FRAME_STAGES.index(stage)]
+        return values[~np.isnan(values)]
+    
+    def histogram(self,stage,bins=20,max_ms=None):
+        values = self.samples(stage)
+        if max_ms is None:
+            max_ms = values.max() if values.size > 0 else 1
+        return np.histogram(values,bins=bins,range=(0,max(max_ms,1e-3)))
+    
+    def summary(self):
+        summary = {}
+        for stage_index,stage in enumerate(FRAME_STAGES):
+            values = self.samples(stage)
+            if values.size == 0:
+                summary[stage] = None
+                continue
+            p50,p95 = np.percentile(values,(50,95))
+            summary[stage] = {'frames': int(self.n_frames[stage_index]),
+                              'mean':   float(values.mean()),
+                              'p50':    float(p50),
+                              'p95':    float(p95),
+                              'max':    float(values.max())}
+        return summary
+
+############################################################################### FrameRing
+
+class FrameRing():
+    
+    def __init__(self,n_slots=8):
+        self.n_slots  = max(int(n_slots),2)
+        self.buffer   = np.zeros((self.n_slots,0,0),np.uint16)
+        self.seq      = np.full(self.n_slots,-1,np.int64)
+        self.count    = np.zeros(self.n_slots,np.int64)
+        self.host_ts  = np.zeros(self.n_slots,np.float64)
+        self.hw_ts    = np.full(self.n_slots,np.nan,np.float64)
+        self.hw_index = np.full(self.n_slots,-1,np.int64)
+        self.stage_ts = np.full((self.n_slots,len(FRAME_STAGES)),np.nan,np.float64)
+        self.last_seq = -1
+        
+    @property
+    def shape(self):
+        return self.buffer.shape[1:]
+        
+    def allocate(self,h,w,dtype=np.uint16):
+        if (self.shape != (h,w)) or (self.buffer.dtype != dtype):
+            self.buffer = np.zeros((self.n_slots,h,w),dtype)
+            self.seq[:] = -1
+            
+    def next_slot(self):
+        # Invalidate the slot before the producer starts overwriting it
+        slot = (self.last_seq + 1) % self.n_slots
+        self.seq[slot] = -1
+        return self.buffer[slot]
+    
+    def publish(self,frame_count,host_timestamp,hw_timestamp=np.nan,hw_frame_index=-1):
+        new_seq = self.last_seq + 1
+        slot    = new_seq % self.n_slots
+        self.count   [slot] = frame_count
+        self.host_ts [slot] = host_timestamp
+        self.hw_ts   [slot] = hw_timestamp
+        self.hw_index[slot] = hw_frame_index
+        self.stage_ts[slot] = np.nan
+        self.seq     [slot] = new_seq
+        self.last_seq    = new_seq
+        return new_seq
+    
+    def mark(self,seq,stage_index,timestamp):
+        # Returns the acquire stamp of the frame, None if it was overwritten
+        slot = seq % self.n_slots
+        if self.seq[slot] != seq:
+            return None
+        self.stage_ts[slot,stage_index] = timestamp
+        return float(self.host_ts[slot])
+        
+    def is_valid(self,seq):
+        return (seq >= 0) and (self.seq[seq % self.n_slots] == seq)
+    
+    def get(self,seq):
+        if self.is_valid(seq):
+            return self.buffer[seq % self.n_slots]
+        return None
+    
+    def get_count(self,seq):
+        return int(self.count[seq % self.n_slots])
+    
+    def get_timestamp(self,seq):
+        return float(self.host_ts[seq % self.n_slots])
+    
+    def get_stamps(self,seq):
+        slot = seq % self.n_slots
+        return float(self.host_ts[slot]),float(self.hw_ts[slot]),int(self.hw_index[slot])
+    
+    def get_stage_stamps(self,seq):
+        return dict(zip(FRAME_STAGES,self.stage_ts[seq % self.n_slots].tolist()))
+
 ############################################################################### CameraDevice
 
 class _CameraDevice(QObject):
@@ -11,16 +135,28 @@ class _CameraDevice(QObject):
     _stopped = pyqtSignal()
     roi_set  = pyqtSignal()
     
-    frame_ready = pyqtSignal()
+    frame_ready = pyqtSignal(int)
     acquisition_started  = pyqtSignal()
     acquisition_finished = pyqtSignal()
     
-    def __init__(self,unique_id,vendor,model,roi_levels,pix_size_nm,exp_time_ms,step_roi_pos=1,step_roi_siz=1):
+    def __init__(self,unique_id,vendor,model,roi_levels,pix_size_nm,exp_time_ms,step_roi_pos=1,step_roi_siz=1,frame_slots=8):
         super().__init__()
         
+        self.frame_ring   = FrameRing(frame_slots)
         self.frame_buffer = np.zeros((0,0))
+        self.frame_seq    = -1
         self.frame_count  = int(0)
-        self.timestamp    = datetime.now()
+        self.dropped_frames = int(0)
+        
+        # Host timestamps are perf_counter seconds, add host_clock_offset for epoch seconds.
+        # Hardware timestamps (seconds) and frame indices come from the driver, NaN/-1 if unknown.
+        self.host_clock_offset = time() - perf_counter()
+        self.timestamp      = perf_counter()
+        self.hw_timestamp   = np.nan
+        self.hw_frame_index = int(-1)
+        
+        self.pipeline_stats = PipelineStats()
+        self._slot_time     = perf_counter()
        
         self.uid         = unique_id
         self.vendor      = vendor
@@ -34,29 +170,72 @@ class _CameraDevice(QObject):
         self.is_busy = False
         self.do_image = False
         self.done_acquiring = False
+        self.snap_session = False
+        
+        # Configuration changes requested during live acquisition are merged into
+        # one transaction: {key:(function,args)}, applied in _config_order.
+        # Keys in live_config_keys are applied between frames without a restart.
+        self._pending_config  = {}
+        self._config_lock     = Lock()
+        self._config_restart  = False
+        self.live_config_keys = set()
         
         self.set_exp_time(exp_time_ms)
         
         # self.hotpix_list = list()
         # self.hotpix_ref  = QRect()
         
-        self._update_configuration_function = None
-        self._update_configuration_argument = None
-        
         self._stopped.connect( self._update_configuration )
         self._acquire.connect( self.acquire_frames )
         
     ##################################################### Configuration updater
     
+    _config_order = ('video_mode','roi','frame_bundle','exp_time')
+    
+    def _request_configuration(self,key,function,*args):
+        with self._config_lock:
+            self._pending_config[key] = (function,args)
+            if not self.do_image:
+                restart = False
+            elif key in self.live_config_keys:
+                return
+            else:
+                restart = True
+                self._config_restart = True
+        if restart:
+            self.stop_acquisition()
+        else:
+            self._apply_configuration()
+    
+    def _apply_configuration(self,live_only=False):
+        with self._config_lock:
+            if live_only and not (self._pending_config.keys() <= self.live_config_keys):
+                return
+            pending,self._pending_config = self._pending_config,{}
+        # An armed snap session is rebuilt around changes that need a restart
+        rearm = self.snap_session and not (pending.keys() <= self.live_config_keys)
+        if rearm:
+            self._do_close_snap_session()
+        for key in self._config_order:
+            if key in pending:
+                function,args = pending[key]
+                function(*args)
+        if rearm:
+            self._do_open_snap_session()
+    
+    def _apply_live_configuration(self):
+        # Called by the acquisition loops between frames
+        if self._pending_config:
+            self._apply_configuration(live_only=True)
+    
     @pyqtSlot()
     def _update_configuration(self):
-        if self._update_configuration_function is not None:
-            if self._update_configuration_argument is None:
-                self._update_configuration_function()
-            else:
-                self._update_configuration_function(*self._update_configuration_argument)
-            self._update_configuration_function = None
-            self._update_configuration_argument = None
+        with self._config_lock:
+            restart = self._config_restart
+            self._config_restart = False
+        if self._pending_config:
+            self._apply_configuration()
+        if restart:
             self._acquire.emit()
         
     ############################################################# Exposure Time
@@ -66,12 +245,7 @@ class _CameraDevice(QObject):
     
     def set_exp_time(self,exp_time_ms):
         self.exp_time_ms = exp_time_ms
-        if self.do_image:
-            self._update_configuration_function = self.write_exp_time
-            self._update_configuration_argument = None
-            self.stop_acquisition()
-        else:
-            self.write_exp_time()
+        self._request_configuration('exp_time',self.write_exp_time)
     
     def get_exp_time(self):
         if self.is_busy:
@@ -105,35 +279,32 @@ class _CameraDevice(QObject):
             if entry is not None:
                 self.roi_list.append(entry)
                 
+    def _target_roi(self):
+        # ROI index after the pending configuration is applied
+        pending = self._pending_config.get('roi')
+        return self.current_roi if pending is None else pending[1][0]
+        
     def next_roi(self,center_x,center_y,box_size):
         area_ratio = 1
-        next_roi = self.current_roi + 1
+        cur_roi  = self._target_roi()
+        next_roi = cur_roi + 1
         if next_roi < self.roi_levels:
             self.config_roi(next_roi,center_x,center_y,box_size)
-            cur_area = self.roi_list[self.current_roi]['rect'].width()*self.roi_list[self.current_roi]['rect'].height()
+            cur_area = self.roi_list[cur_roi]['rect'].width()*self.roi_list[cur_roi]['rect'].height()
             new_area = self.roi_list[next_roi]['rect'].width()*self.roi_list[next_roi]['rect'].height()
             area_ratio = new_area/cur_area
-            if self.do_image:
-                self._update_configuration_function = self.set_roi_by_index
-                self._update_configuration_argument = (next_roi,)
-                self.stop_acquisition()
-            else:
-                self.set_roi_by_index(next_roi)
+            self._request_configuration('roi',self.set_roi_by_index,next_roi)
         return area_ratio
     
     def previous_roi(self):
         area_ratio = 1
-        previous_roi = self.current_roi - 1
+        cur_roi      = self._target_roi()
+        previous_roi = cur_roi - 1
         if previous_roi >= 0:
-            cur_area = self.roi_list[self.current_roi]['rect'].width()*self.roi_list[self.current_roi]['rect'].height()
+            cur_area = self.roi_list[cur_roi]['rect'].width()*self.roi_list[cur_roi]['rect'].height()
             new_area = self.roi_list[previous_roi]['rect'].width()*self.roi_list[previous_roi]['rect'].height()
             area_ratio = new_area/cur_area
-            if self.do_image:
-                self._update_configuration_function = self.set_roi_by_index
-                self._update_configuration_argument = (previous_roi,)
-                self.stop_acquisition()
-            else:
-                self.set_roi_by_index(previous_roi)
+            self._request_configuration('roi',self.set_roi_by_index,previous_roi)
         return area_ratio
     
     def config_roi(self,roi_index,center_x,center_y,box_size):
@@ -198,6 +369,56 @@ class _CameraDevice(QObject):
         entry = {'rect':QRect(),'halo':0}
         return entry
     
+    ################################################################ Frame Ring
+    
+    def _ring_prepare(self,h,w,dtype=np.uint16):
+        self.frame_ring.allocate(int(h),int(w),dtype)
+    
+    def _ring_slot(self):
+        self._slot_time = perf_counter()
+        return self.frame_ring.next_slot()
+    
+    def _stamp_frame(self,hw_timestamp=np.nan,hw_frame_index=-1):
+        self.timestamp      = perf_counter()
+        self.hw_timestamp   = hw_timestamp
+        self.hw_frame_index = hw_frame_index
+    
+    def _ring_publish(self):
+        self.frame_seq    = self.frame_ring.publish(self.frame_count,self.timestamp,self.hw_timestamp,self.hw_frame_index)
+        self.frame_buffer = self.frame_ring.get(self.frame_seq)
+        self.frame_ring.mark(self.frame_seq,0,self.timestamp)
+        self.pipeline_stats.push(0,1000*(self.timestamp-self._slot_time))
+        self.mark_frame_stage(self.frame_seq,'emit')
+        self.frame_ready.emit(self.frame_seq)
+    
+    def mark_frame_stage(self,seq,stage,acquired=None):
+        # Stamp a frame when it leaves a stage of the pipeline (see FRAME_STAGES).
+        # Consumers holding a copy pass its acquire stamp, the ring slot may be reused.
+        now = perf_counter()
+        stage_index = FRAME_STAGES.index(stage)
+        ring_acquired = self.frame_ring.mark(seq,stage_index,now)
+        if ring_acquired is not None:
+            acquired = ring_acquired
+        if acquired is None:
+            return False
+        self.pipeline_stats.push(stage_index,1000*(now-acquired))
+        return True
+    
+    def get_frame_stage_stamps(self,seq):
+        return self.frame_ring.get_stage_stamps(seq)
+    
+    def get_frame(self,seq):
+        return self.frame_ring.get(seq)
+    
+    def is_frame_valid(self,seq):
+        return self.frame_ring.is_valid(seq)
+    
+    def get_frame_timestamp(self,seq):
+        return self.frame_ring.get_timestamp(seq)
+    
+    def get_frame_stamps(self,seq):
+        return self.frame_ring.get_stamps(seq)
+    
     ################################################################ Snap Frame
     
     @pyqtSlot()
@@ -207,8 +428,36 @@ class _CameraDevice(QObject):
             return
         
         self.is_busy = True
-        self._do_snap_frame()
+        if self.snap_session:
+            self._do_snap_frame()
+        else:
+            self._do_open_snap_session()
+            self._do_snap_frame()
+            self._do_close_snap_session()
         self.is_busy = False
+    
+    # A snap session keeps buffers and acquisition armed across snap_frame
+    # calls (e.g. one snap per z step) until close_snap_session is called.
+    @pyqtSlot()
+    def open_snap_session(self):
+        if self.is_busy:
+            print(f'{self.uid}: [{self.vendor} - {self.model}] Busy - Ignoring snap session request.')
+            return
+        if not self.snap_session:
+            self._do_open_snap_session()
+            self.snap_session = True
+    
+    @pyqtSlot()
+    def close_snap_session(self):
+        if self.snap_session:
+            self.snap_session = False
+            self._do_close_snap_session()
+        
+    def _do_open_snap_session(self): # To Be Implemented by Child
+        pass
+    
+    def _do_close_snap_session(self): # To Be Implemented by Child
+        pass
         
     def _do_snap_frame(self): # To Be Implemented by Child
         print(f'_do_snap_frame not implemented ({self.uid}: {self.vendor} - {self.model})')
@@ -225,10 +474,15 @@ class _CameraDevice(QObject):
             print(f'{self.uid}: [{self.vendor} - {self.model}] Busy - Ignoring snap request.')
             return
         
+        self.close_snap_session()
         self.is_busy  = True
         self.do_image = True
+        self.dropped_frames = 0
+        self.host_clock_offset = time() - perf_counter()
         self.acquisition_started.emit()
         self._do_acquire_frames(max_frames)
+        if self.dropped_frames > 0:
+            print(f'[{self.uid}: {self.vendor} - {self.model}] {self.dropped_frames} frames dropped out of {self.frame_count+self.dropped_frames}.')
         self.is_busy = False
         self._stopped.emit()
         self.acquisition_finished.emit()
@@ -248,14 +502,21 @@ class DummyCamera(_CameraDevice):
     
     ############################################################# CTOR and DTOR
     
-    def __init__(self,name,camera_index=0,exposure_time_ms=100):
-        self.raw_image = _imread('resources/SWTestbild_upscaled.tif')
+    def __init__(self,name,camera_index=0,exposure_time_ms=100,noise_model='gaussian',seed=None):
+        self.raw_image = self._load_raw_image()
+        
+        self._rng         = np.random.default_rng(seed)
+        self._sim_key     = None
+        self._noise_bank  = None
+        self.noise_model  = noise_model
+        self.noise_factor = 2
         
         vendor = 'TestCamera'
         model  = 'Telefunken_Test_Card_T05'
         roi_levels = 3
         
         super().__init__(name,vendor,model,roi_levels,136,exposure_time_ms,step_roi_pos=4,step_roi_siz=8)
+        self.live_config_keys = {'exp_time'}
         
         self.init_roi_list()
         self.set_roi_by_index(0)
@@ -269,6 +530,9 @@ class DummyCamera(_CameraDevice):
     def __del__(self):
         pass
     
+    def _load_raw_image(self):
+        return _imread('resources/SWTestbild_upscaled.tif')
+    
     ############################################### Implement common properties
     
     def _get_full_chip_size(self):
@@ -296,41 +560,195 @@ class DummyCamera(_CameraDevice):
     def read_exp_time(self):
         return self.exp_time_ms
     
+    ##################################################### Simulation settings
+    
+    def get_noise_model_range(self):
+        return ['none','gaussian','shot','poisson']
+    
+    def set_noise_model(self,noise_model:str,seed=None):
+        assert noise_model in self.get_noise_model_range(), f'Invalid noise model {noise_model}'
+        self.noise_model = noise_model
+        if seed is not None:
+            self._rng = np.random.default_rng(seed)
+        self._sim_key = None
+    
+    def _prepare_simulation(self):
+        # Crop and noise bank are rebuilt only when ROI, exposure or noise model change
+        sim_key = (self.x0,self.y0,self.x1,self.y1,self.exp_time_ms,self.noise_model)
+        if sim_key == self._sim_key:
+            return
+        self._sim_key = sim_key
+        
+        self._crop_f32   = np.float32(self.raw_image[self.y0:self.y1,self.x0:self.x1])
+        self._crop_sqrt  = np.sqrt(self._crop_f32)
+        self._buffer_f32 = np.empty_like(self._crop_f32)
+        
+        # A flat bank larger than one frame, each frame reads it at a random offset
+        if self.noise_model in ('gaussian','shot'):
+            bank_size = self.noise_factor*self._crop_f32.size
+            self._noise_bank = self._rng.standard_normal(bank_size,dtype=np.float32)
+            if self.noise_model == 'gaussian':
+                self._noise_bank *= np.float32(25*(300-self.exp_time_ms))
+        else:
+            self._noise_bank = None
+    
     ##################################################### Acquisition functions
     
-    def _gen_frame(self):
-        self._buffer_f32  = np.float32(self.raw_image[self.y0:self.y1,self.x0:self.x1])
-        self._buffer_f32 += np.random.normal(0,25*(300-self.exp_time_ms),self._buffer_f32.shape)
-        self._buffer_u16  = np.uint16( self._buffer_f32.clip(0,65535) )
-        return self._buffer_u16
+    def _gen_frame(self,out):
+        self._prepare_simulation()
+        
+        if self.noise_model == 'poisson':
+            np.copyto(out,self._rng.poisson(self._crop_f32).clip(0,65535),casting='unsafe')
+            return out
+        
+        if self._noise_bank is None:
+            np.copyto(out,self._crop_f32.clip(0,65535),casting='unsafe')
+            return out
+        
+        n_pix  = self._crop_f32.size
+        offset = int(self._rng.integers(0,self._noise_bank.size-n_pix+1))
+        noise  = self._noise_bank[offset:offset+n_pix].reshape(self._crop_f32.shape)
+        if self.noise_model == 'shot':
+            np.multiply(noise,self._crop_sqrt,out=self._buffer_f32)
+            self._buffer_f32 += self._crop_f32
+        else:
+            np.add(self._crop_f32,noise,out=self._buffer_f32)
+        np.clip(self._buffer_f32,0,65535,out=self._buffer_f32)
+        np.copyto(out,self._buffer_f32,casting='unsafe')
+        return out
+        
+    def _do_open_snap_session(self):
+        self._ring_prepare(self.y1-self.y0,self.x1-self.x0)
         
     def _do_snap_frame(self):
-        self.frame_buffer = self._gen_frame()
+        self._gen_frame(self._ring_slot())
         self.frame_count  = 0
-        self.timestamp    = datetime.now()
-        self.frame_ready.emit()
+        self._stamp_frame()
+        self._ring_publish()
         
     @pyqtSlot()
     def _do_acquire_frames(self,max_frames):
         
+        self._ring_prepare(self.y1-self.y0,self.x1-self.x0)
         self.frame_count = 0
         self.done_acquiring = False
         
         while self.do_image and not self.done_acquiring:
-            t0 = datetime.now()
-            self.frame_buffer = self._gen_frame()
-            self.timestamp    = datetime.now()
+            self._apply_live_configuration()
+            t0 = perf_counter()
+            self._gen_frame(self._ring_slot())
+            self._stamp_frame()
             self.frame_count += 1
-            self.frame_ready.emit()
-            t1 = datetime.now()
-            delta = t1 - t0
-            delta = delta.total_seconds()*1000
+            self._ring_publish()
+            t1 = perf_counter()
+            delta = (t1 - t0)*1000
             if delta < self.exp_time_ms:
                 _sleep( (self.exp_time_ms-delta)/1000 )
             self.done_acquiring = (self.frame_count>=max_frames) and (max_frames>0)
         self.do_image = False
         self.done_acquiring = True
 
+############################################################################### DummyBeadCamera
+
+class DummyBeadCamera(DummyCamera):
+    
+    ############################################################# CTOR and DTOR
+    
+    def __init__(self,name,camera_index=0,exposure_time_ms=10,chip_size=64,noise_model='gaussian',seed=None):
+        self.chip_size = int(chip_size)
+        
+        super().__init__(name,camera_index,exposure_time_ms,noise_model,seed)
+        self.model = 'Astigmatic_Bead_Simulator'
+        
+        self.stage = None
+        
+        # Stage to sample z conversion, the beads are in focus at step 0 and focus_voltage
+        self.nm_per_step   = 50.0
+        self.nm_per_volt   = 20.0
+        self.focus_voltage = 65.0
+        
+        # Astigmatic PSF: sigma_x,y(z) = psf_sigma_px * sqrt( 1 + ((z -/+ psf_astig_nm)/psf_depth_nm)^2 )
+        self.psf_sigma_px = 2.0
+        self.psf_astig_nm = 400.0
+        self.psf_depth_nm = 500.0
+        
+        self.background = 100.0
+        self.read_noise = 5.0
+        
+        self.z_drift_nm_per_s  = 0.0
+        self.xy_drift_px_per_s = (0.0,0.0)
+        self.z_offset_nm       = 0.0
+        
+        self._sim_t0 = perf_counter()
+        self.set_beads( [(0.5*self.chip_size,0.5*self.chip_size,4000.0)] )
+        
+    def _load_raw_image(self):
+        return np.zeros( (self.chip_size,self.chip_size), np.uint16 )
+    
+    ##################################################### Simulation settings
+    
+    def set_stage(self,stage):
+        self.stage = stage
+    
+    def set_beads(self,bead_list):
+        # bead_list: (x,y,amplitude) in full chip pixels
+        beads = np.array(bead_list,np.float32).reshape(-1,3)
+        self._bead_x   = beads[:,0]
+        self._bead_y   = beads[:,1]
+        self._bead_amp = beads[:,2]
+    
+    def reset_drift(self):
+        self._sim_t0 = perf_counter()
+    
+    def get_sim_z_nm(self):
+        z_nm = self.z_offset_nm + self.z_drift_nm_per_s*(perf_counter()-self._sim_t0)
+        if self.stage is not None:
+            z_nm += self.nm_per_step*self.stage.step_counter['z']
+            z_nm += self.nm_per_volt*(self.stage.offset_tracker['z']-self.focus_voltage)
+        return z_nm
+    
+    def get_psf_sigmas(self,z_nm):
+        sigma_x = self.psf_sigma_px*np.sqrt( 1 + ((z_nm-self.psf_astig_nm)/self.psf_depth_nm)**2 )
+        sigma_y = self.psf_sigma_px*np.sqrt( 1 + ((z_nm+self.psf_astig_nm)/self.psf_depth_nm)**2 )
+        return sigma_x,sigma_y
+    
+    def _prepare_simulation(self):
+        sim_key = (self.x0,self.y0,self.x1,self.y1)
+        if sim_key == self._sim_key:
+            return
+        self._sim_key = sim_key
+        self._axis_x = np.arange(self.x0,self.x1,dtype=np.float32)
+        self._axis_y = np.arange(self.y0,self.y1,dtype=np.float32)
+        self._buffer_f32 = np.zeros( (self.y1-self.y0,self.x1-self.x0), np.float32 )
+    
+    ##################################################### Acquisition functions
+    
+    def _gen_frame(self,out):
+        self._prepare_simulation()
+        
+        t = perf_counter() - self._sim_t0
+        sigma_x,sigma_y = self.get_psf_sigmas( self.get_sim_z_nm() )
+        bead_x = self._bead_x + self.xy_drift_px_per_s[0]*t
+        bead_y = self._bead_y + self.xy_drift_px_per_s[1]*t
+        
+        # Separable Gaussians, all beads rendered with a single matrix product
+        profile_x = np.exp( -0.5*((self._axis_x[None,:]-bead_x[:,None])/sigma_x)**2 )
+        profile_y = np.exp( -0.5*((self._axis_y[None,:]-bead_y[:,None])/sigma_y)**2 )
+        profile_y *= self._bead_amp[:,None]
+        np.matmul(profile_y.T,profile_x,out=self._buffer_f32)
+        self._buffer_f32 += self.background
+        
+        if self.noise_model == 'poisson':
+            np.copyto(out,self._rng.poisson(self._buffer_f32).clip(0,65535),casting='unsafe')
+            return out
+        elif self.noise_model == 'shot':
+            self._buffer_f32 += np.sqrt(self._buffer_f32)*self._rng.standard_normal(self._buffer_f32.shape,dtype=np.float32)
+        elif self.noise_model == 'gaussian':
+            self._buffer_f32 += self.read_noise*self._rng.standard_normal(self._buffer_f32.shape,dtype=np.float32)
+        np.clip(self._buffer_f32,0,65535,out=self._buffer_f32)
+        np.copyto(out,self._buffer_f32,casting='unsafe')
+        return out
+
 ############################################################################### HamamatsuCamera
 
 try:
@@ -346,7 +764,7 @@ if _should_use_dcam:
         
         ############################################################# CTOR and DTOR
         
-        def __init__(self,name,camera_index=0,exposure_time_ms=100,default_roi=0,step_roi_pos=8,step_roi_siz=8):
+        def __init__(self,name,camera_index=0,exposure_time_ms=100,default_roi=0,step_roi_pos=8,step_roi_siz=8,n_buffers=32,ring_slots=8):
             
             assert Dcamapi.init(), "Cannot connect to DCAM (Hamamatsu) driver.\n Do you have one? or is it being used by another software?"
             self.camera = Dcam(camera_index)
@@ -361,12 +779,22 @@ if _should_use_dcam:
                              pix_size_nm=136,
                              exp_time_ms=exposure_time_ms,
                              step_roi_pos=4,
-                             step_roi_siz=8)
+                             step_roi_siz=8,
+                             frame_slots=ring_slots)
+            
+            # Exposure is changed between frames when the camera accepts it while capturing
+            exp_attr = self.camera.prop_getattr(DCAM_IDPROP.EXPOSURETIME)
+            if exp_attr is not False and exp_attr.is_accessbusy():
+                self.live_config_keys = {'exp_time'}
             
             self.init_roi_list()
             self.set_roi_by_index(0)
             
             self.frame_timeout_ms = 1000
+            self.n_buffers        = max(int(n_buffers),3)
+            self.drain_all_frames = True
+            self.frame_bundle     = 1
+            self.write_frame_bundle(1)
             self.set_cooler_on()
             self.set_uint16()
             self.set_roi_by_index(default_roi)
@@ -432,34 +860,128 @@ if _should_use_dcam:
         def read_exp_time(self):
             return self.camera.prop_getvalue(DCAM_IDPROP.EXPOSURETIME)*1000
         
+        ############################################################# Frame Bundle
+        
+        # In frame-bundle mode DCAM transfers n_bundle images stacked vertically
+        # in one buffer frame, i.e. one event wait for n_bundle images. Meant for
+        # small ROIs, where the per-frame loop cannot keep up with the camera.
+        # Live acquisition unpacks the bundles into the frame ring, snaps are
+        # taken with bundling off.
+        
+        def set_frame_bundle(self,n_bundle):
+            self._request_configuration('frame_bundle',self.write_frame_bundle,n_bundle)
+        
+        def get_frame_bundle(self):
+            return self.frame_bundle
+        
+        def write_frame_bundle(self,n_bundle):
+            n_bundle = max(int(n_bundle),1)
+            if n_bundle > 1:
+                if self.camera.prop_setvalue(DCAM_IDPROP.FRAMEBUNDLE_NUMBER,n_bundle) and self.camera.prop_setvalue(DCAM_IDPROP.FRAMEBUNDLE_MODE,DCAMPROP.MODE.ON):
+                    self.frame_bundle = n_bundle
+                    return
+                print(f'[{self.uid}: {self.vendor} - {self.model}] Frame bundle of {n_bundle} not supported, using single frames.')
+            self.camera.prop_setvalue(DCAM_IDPROP.FRAMEBUNDLE_MODE,DCAMPROP.MODE.OFF)
+            self.frame_bundle = 1
+        
         ##################################################### Acquisition functions
         
-        def _do_snap_frame(self):
+        def _ring_prepare_from_camera(self,n_bundle=1):
+            # Frame geometry is cached by buf_alloc, once per capture session
+            h,w = self.camera.buf_getframeshape()
+            self._ring_prepare(h//n_bundle,w)
+            
+        def _copy_frame_to_ring(self,frame_index=-1):
+            # Copy straight from the DCAM buffer into the preallocated ring slot
+            frame_info = self.camera.buf_copyframe(frame_index,self._ring_slot())
+            if frame_info is False:
+                return False
+            hw_timestamp = frame_info.timestamp.sec + 1e-6*frame_info.timestamp.microsec
+            self._stamp_frame(hw_timestamp,frame_info.framestamp)
+            return True
+        
+        def _publish_bundle(self,frame_index,max_frames):
+            # Unpack the images of a locked bundle into ring slots, the DCAM
+            # buffer is only read while the driver still holds this frame.
+            ret = self.camera.buf_lockframe(frame_index)
+            if ret is False:
+                self.dropped_frames += self.frame_bundle
+                return
+            frame_info,bundle = ret
+            h = frame_info.height
+            hw_timestamp = frame_info.timestamp.sec + 1e-6*frame_info.timestamp.microsec
+            for i in range(self.frame_bundle):
+                np.copyto(self._ring_slot(),bundle[i*h:(i+1)*h])
+                # The bundle carries a single timestamp, the index counts images
+                self._stamp_frame(hw_timestamp,frame_info.framestamp*self.frame_bundle+i)
+                self.frame_count += 1
+                self._ring_publish()
+                if (self.frame_count>=max_frames) and (max_frames>0):
+                    break
+        
+        def _do_open_snap_session(self):
+            if self.frame_bundle > 1:
+                self.camera.prop_setvalue(DCAM_IDPROP.FRAMEBUNDLE_MODE,DCAMPROP.MODE.OFF)
             assert self.camera.buf_alloc(1), "Failed to create buffer for camera"
+            self._ring_prepare_from_camera()
             
+        def _do_close_snap_session(self):
+            self.camera.cap_stop()
+            self.camera.buf_release()
+            if self.frame_bundle > 1:
+                self.camera.prop_setvalue(DCAM_IDPROP.FRAMEBUNDLE_MODE,DCAMPROP.MODE.ON)
+            
+        def _do_snap_frame(self):
+            # Each snapshot captures one new frame into the buffer allocated by the session
             if self.camera.cap_snapshot():
-                if self.camera.wait_capevent_frameready(self.frame_timeout_ms):
-                    self.frame_buffer = self.camera.buf_getlastframedata()
+                if self.camera.wait_capevent_frameready(self.frame_timeout_ms) and self._copy_frame_to_ring():
                     self.frame_count  = 0
-                    self.timestamp    = datetime.now()
-                    self.frame_ready.emit()
-            
-            self.camera.buf_release()
+                    self._ring_publish()
             
         @pyqtSlot()
         def _do_acquire_frames(self,max_frames):
             
-            assert self.camera.buf_alloc(3), "Failed to create buffer for camera"
+            assert self.camera.buf_alloc(self.n_buffers), "Failed to create buffer for camera"
+            n_bundle = self.frame_bundle
+            self._ring_prepare_from_camera(n_bundle)
             
             self.frame_count = 0
             self.done_acquiring = False
+            captured_count = 0
             if self.camera.cap_start():
                 while self.do_image and not self.done_acquiring:
-                    if self.camera.wait_capevent_frameready(self.frame_timeout_ms):
-                        self.frame_buffer = self.camera.buf_getlastframedata()
-                        self.timestamp    = datetime.now()
-                        self.frame_count += 1
-                        self.frame_ready.emit()
+                    self._apply_live_configuration()
+                    # A bundle is only transferred once all its images are exposed
+                    timeout_ms = max(self.frame_timeout_ms,int(2*n_bundle*self.exp_time_ms))
+                    if self.camera.wait_capevent_frameready(timeout_ms):
+                        transfer_info = self.camera.cap_transferinfo()
+                        if transfer_info is False:
+                            continue
+                        
+                        # nFrameCount counts every captured frame (bundle) since cap_start,
+                        # the driver keeps the last n_buffers of them.
+                        first_count = captured_count
+                        last_count  = transfer_info.nFrameCount
+                        if last_count <= captured_count:
+                            continue # woken up without a new frame
+                        if not self.drain_all_frames:
+                            first_count = max(captured_count,last_count-1)
+                        elif (last_count - first_count) > (self.n_buffers-1):
+                            # Skip the oldest buffer, it is the next one the driver overwrites
+                            first_count = last_count - (self.n_buffers-1)
+                        self.dropped_frames += (first_count - captured_count)*n_bundle
+                        
+                        for frame_number in range(first_count,last_count):
+                            if n_bundle > 1:
+                                self._publish_bundle(frame_number % self.n_buffers,max_frames)
+                            elif self._copy_frame_to_ring(frame_number % self.n_buffers):
+                                self.frame_count += 1
+                                self._ring_publish()
+                            else:
+                                self.dropped_frames += 1
+                            if (self.frame_count>=max_frames) and (max_frames>0):
+                                break
+                        captured_count = last_count
                     self.done_acquiring = (self.frame_count>=max_frames) and (max_frames>0)
                 self.do_image = False
                 self.done_acquiring = True
@@ -498,6 +1020,8 @@ if _should_use_pyspin:
             
             self._exp_real_time_ms = 20
             self._exp_buffer_size  = 0
+            self._accumulator      = np.zeros( (0,0), np.uint32 )
+            self.accumulate_mode   = 'mean'
             
             # Configuration of common parameter for cameras
             super().__init__(name,vendor,model,roi_levels,
@@ -505,6 +1029,8 @@ if _should_use_pyspin:
                              exp_time_ms=exposure_time_ms,
                              step_roi_pos=4,
                              step_roi_siz=8)
+            # The accumulated exposure only changes the number of sub-exposures
+            self.live_config_keys = {'exp_time'}
             
             # Configure camera
             # Load default
@@ -522,6 +1048,9 @@ if _should_use_pyspin:
             # Set Pixel format
             self.set_uint16()
             
+            # Per-image timestamp and frame counter
+            self.enable_chunk_data()
+            
             # Default Video Mode
             self.set_video_mode('Mode1')
             
@@ -538,16 +1067,38 @@ if _should_use_pyspin:
         def set_uint16(self):
             self.camera.PixelFormat.SetValue(pyspin.PixelFormat_Mono16)
             
+        def enable_chunk_data(self):
+            self.use_chunk_data = False
+            try:
+                nodemap       = self.camera.GetNodeMap()
+                chunk_active  = pyspin.CBooleanPtr(nodemap.GetNode("ChunkModeActive"))
+                chunk_select  = pyspin.CEnumerationPtr(nodemap.GetNode("ChunkSelector"))
+                chunk_enable  = pyspin.CBooleanPtr(nodemap.GetNode("ChunkEnable"))
+                chunk_active.SetValue(True)
+                for entry in chunk_select.GetEntries():
+                    entry = pyspin.CEnumEntryPtr(entry)
+                    if entry.GetSymbolic() in ('Timestamp','FrameID','FrameCounter'):
+                        chunk_select.SetIntValue(entry.GetValue())
+                        chunk_enable.SetValue(True)
+                self.use_chunk_data = True
+            except pyspin.SpinnakerException as e:
+                print(f'[{self.uid}: {self.vendor} - {self.model}] Chunk data not available, using image stamps ({e}).')
+        
+        def _read_image_stamps(self,in_image):
+            if self.use_chunk_data:
+                chunk_data = in_image.GetChunkData()
+                return 1e-9*chunk_data.GetTimestamp(),chunk_data.GetFrameID()
+            else:
+                return 1e-9*in_image.GetTimeStamp(),in_image.GetFrameID()
+            
         def get_video_mode_range(self):
             return ['Mode0','Mode1']
         
         def set_video_mode(self,video_mode:str):
-            if self.do_image:
-                self._update_configuration_function = self.write_video_mode
-                self._update_configuration_argument = (video_mode,)
-                self.stop_acquisition()
-            else:
-                self.write_video_mode(video_mode)
+            # A new video mode resets the ROI list, drop any ROI change queued before it
+            with self._config_lock:
+                self._pending_config.pop('roi',None)
+            self._request_configuration('video_mode',self.write_video_mode,video_mode)
         
         def write_video_mode(self,video_mode:str):
             self.video_mode  = video_mode
@@ -614,33 +1165,56 @@ if _should_use_pyspin:
         
         ##################################################### Acquisition functions
         
-        def _do_snap_frame(self):
-            w = self.camera.Width.GetValue()
-            h = self.camera.Height.GetValue()
-            self._internal_frame_buffer = np.zeros( (self._exp_buffer_size,int(h),int(w)), np.uint16 )
-            
-            self.camera.BeginAcquisition()
-            
+        def set_accumulate_mode(self,mode:str):
+            # 'mean' keeps uint16 frames, 'sum' emits uint32 frames with the raw sum of sub-exposures
+            assert mode in ('mean','sum'), f'Invalid accumulation mode {mode}'
+            self.accumulate_mode = mode
+        
+        def _prepare_accumulator(self):
+            w = int(self.camera.Width.GetValue())
+            h = int(self.camera.Height.GetValue())
+            if self._accumulator.shape != (h,w):
+                self._accumulator = np.zeros( (h,w), np.uint32 )
+            self._ring_prepare(h,w,np.uint32 if self.accumulate_mode == 'sum' else np.uint16)
+        
+        def _grab_accumulated_frame(self,software_trigger=False):
+            # Sub-exposures are added in place as they arrive, no intermediate stack
+            self._accumulator.fill(0)
             for i in range(self._exp_buffer_size):
-                # Grab image
+                if software_trigger:
+                    self.camera.TriggerSoftware.Execute()
                 in_image = self.camera.GetNextImage()
-                in_w     = in_image.GetWidth()
-                in_h     = in_image.GetHeight()
-                self._internal_frame_buffer[i,:,:] = np.array(in_image.GetData()).reshape( (in_h,in_w) )
+                if i == 0:
+                    hw_stamps = self._read_image_stamps(in_image)
+                np.add(self._accumulator,in_image.GetNDArray(),out=self._accumulator)
                 in_image.Release()
-                
-            self.frame_buffer = np.uint16(self._internal_frame_buffer.mean(axis=0).clip(0,65535))
-            self.frame_count  = 0
-            self.timestamp    = datetime.now()
-            self.frame_ready.emit()
-                
+            
+            if self.accumulate_mode == 'sum':
+                np.copyto(self._ring_slot(),self._accumulator)
+            else:
+                np.floor_divide(self._accumulator,self._exp_buffer_size,out=self._ring_slot(),casting='unsafe')
+            self._stamp_frame(*hw_stamps)
+        
+        def _do_open_snap_session(self):
+            # Stay armed on software trigger, every sub-exposure starts when a snap asks for it
+            self._prepare_accumulator()
+            self.camera.TriggerMode.SetValue(pyspin.TriggerMode_Off)
+            self.camera.TriggerSource.SetValue(pyspin.TriggerSource_Software)
+            self.camera.TriggerMode.SetValue(pyspin.TriggerMode_On)
+            self.camera.BeginAcquisition()
+            
+        def _do_close_snap_session(self):
             self.camera.EndAcquisition()
+            self.camera.TriggerMode.SetValue(pyspin.TriggerMode_Off)
+            
+        def _do_snap_frame(self):
+            self._grab_accumulated_frame(software_trigger=True)
+            self.frame_count  = 0
+            self._ring_publish()
             
         @pyqtSlot()
         def _do_acquire_frames(self,max_frames):
-            w = self.camera.Width.GetValue()
-            h = self.camera.Height.GetValue()
-            self._internal_frame_buffer = np.zeros( (self._exp_buffer_size,int(h),int(w)), np.uint16 )
+            self._prepare_accumulator()
             
             self.camera.BeginAcquisition()
             
@@ -649,18 +1223,10 @@ if _should_use_pyspin:
             
             while self.do_image and not self.done_acquiring:
                 
-                for i in range(self._exp_buffer_size):
-                    # Grab image
-                    in_image = self.camera.GetNextImage()
-                    in_w     = in_image.GetWidth()
-                    in_h     = in_image.GetHeight()
-                    self._internal_frame_buffer[i,:,:] = np.array(in_image.GetData()).reshape( (in_h,in_w) )
-                    in_image.Release()
-                    
-                self.frame_buffer = np.uint16(self._internal_frame_buffer.mean(axis=0).clip(0,65535))
-                self.timestamp    = datetime.now()
+                self._apply_live_configuration()
+                self._grab_accumulated_frame()
                 self.frame_count += 1
-                self.frame_ready.emit()
+                self._ring_publish()
                 
                 self.done_acquiring = (self.frame_count>=max_frames) and (max_frames>0)
             
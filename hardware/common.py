@@ -1,4 +1,7 @@
 from PyQt5.QtCore import QObject, QThread
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import perf_counter
 
 class Device(QObject):
     def __init__(self,dev_name:str,dev_type:str,dev_vendor:str,dev_model:str,parent=None):
@@ -13,6 +16,8 @@ class Device(QObject):
         self.moveToThread(self._thread)
         self._thread.start()
         
+        self.state_listener = None
+        
         self.set_busy(False)
         
     @property
@@ -31,6 +36,11 @@ class Device(QObject):
         
     def is_active(self) -> bool:
         return self._thread.isRunning()
+    
+    def state_changed(self):
+        # Devices call this after changing a value that is saved per frame
+        if self.state_listener is not None:
+            self.state_listener(self)
         
     def free(self):
         if self._thread.isRunning():
@@ -38,9 +48,26 @@ class Device(QObject):
             self._thread.wait()
         print(f'Device {self.full_name}: Bye.')
             
+class DeviceStateStore:
+    # Latest device state, pushed by the devices when it changes. Every update
+    # publishes a new (version,state) pair that is never modified afterwards,
+    # so readers get a consistent snapshot with a single reference read.
+    def __init__(self):
+        self._lock     = Lock()
+        self._snapshot = (0,{})
+    
+    def update(self,**values):
+        with self._lock:
+            version,state  = self._snapshot
+            self._snapshot = (version+1,{**state,**values})
+    
+    def snapshot(self) -> tuple:
+        return self._snapshot
+
 class DeviceManager:
     def __init__(self):
         self.dev_dict:dict[str,Device] = {}
+        self.state = DeviceStateStore()
     
     def add(self,dev:Device):
         if dev.name in self.dev_dict:
@@ -49,6 +76,16 @@ class DeviceManager:
         
         self.dev_dict[dev.name] = dev
         setattr(self,dev.name,dev)
+        dev.state_listener = self.update_state
+        self.update_state(dev)
+    
+    def update_state(self,dev:Device):
+        if dev.type == 'Stage':
+            self.state.update(x=dev.step_counter['x'],y=dev.step_counter['y'],z=dev.step_counter['z'])
+        elif dev.type == 'Laser':
+            self.state.update(laser=self.get_active_laser())
+        elif dev.type == 'FilterWheel':
+            self.state.update(filter_pos=dev.pos,filter_name=dev.current_position_name())
     
     def free(self):
         for dev in self.dev_dict.values():
@@ -61,11 +98,62 @@ class DeviceManager:
                 if isinstance(dev.power_status, list):
                     for i in range(len(dev.power_status)):
                         if dev.power_status[i]:
-                            return index+(i/10),dev.name+f'.{i}',dev.power_value[i],dev.power_value_unit
+                            power_value = getattr(dev,'power_value',None)
+                            power_value = power_value[i] if isinstance(power_value,list) else 0
+                            return index+(i/10),dev.name+f'.{i}',power_value,getattr(dev,'power_value_unit','none')
                 else:
                     if dev.power_status:
-                        return index,dev.name,dev.power_value,dev.power_value_unit
+                        return index,dev.name,getattr(dev,'power_value',0),getattr(dev,'power_value_unit','none')
                 index += 1
         return 'none',0,0,'none'
 
-
+class DeviceLoader:
+    # Opens independent devices concurrently, each factory runs in a worker
+    # thread and returns the device. Devices left in the worker thread, and the
+    # QThread a Device runs in, are handed to the calling thread since the
+    # worker thread exits once loading is done.
+    def __init__(self,max_workers=8):
+        self.max_workers = max_workers
+        self.factories   = {}
+        self.devices     = {}
+        self.timings_ms  = {}
+    
+    def add(self,key:str,factory):
+        self.factories[key] = factory
+    
+    def run(self,report=None) -> dict:
+        owner_thread = QThread.currentThread()
+        
+        def _open(key):
+            t_start = perf_counter()
+            dev = self.factories[key]()
+            for obj in (dev,getattr(dev,'_thread',None)):
+                if isinstance(obj,QObject) and obj.thread() == QThread.currentThread():
+                    obj.moveToThread(owner_thread)
+            return dev,1000*(perf_counter()-t_start)
+        
+        errors = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(_open,key): key for key in self.factories}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    self.devices[key],self.timings_ms[key] = future.result()
+                except Exception as e:
+                    print(f'Device {key}: failed to open ({e})')
+                    errors[key] = e
+                if report is not None:
+                    report(key,self.timings_ms.get(key))
+        
+        print('Device bring-up:')
+        for key,ms in sorted(self.timings_ms.items(),key=lambda item: -item[1]):
+            print(f'    {key:<24}{ms:8.0f} ms')
+        
+        if errors:
+            # Do not leave the threads of the devices that did open running
+            for dev in self.devices.values():
+                if hasattr(dev,'free'):
+                    dev.free()
+            self.devices = {}
+            raise next(iter(errors.values()))
+        return self.devices
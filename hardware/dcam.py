@@ -90,6 +90,36 @@ def dcammisc_alloc_ndarray(frame: DCAMBUF_FRAME, framebundlenum=1, viewnum=1):
     return False
 
 
+def dcammisc_view_ndarray(frame: DCAMBUF_FRAME, framebundlenum=1, viewnum=1):
+    """Wrap DCAM-owned image memory as NumPy ndarray.
+
+    Create a NumPy ndarray view on the memory pointed by DCAMBUF_FRAME.buf
+    without copying it. The view is only valid while DCAM keeps the frame,
+    i.e. until the buffer is overwritten by the capture or released.
+
+    Args:
+        frame (DCAMBUF_FRAME): Frame information filled by dcambuf_lockframe().
+        framebundlenum (int): Frame Bundle number.
+        viewnum(int) : Number of views.
+
+    Returns:
+        NumPy ndarray: NumPy ndarray view on the DCAM buffer.
+        bool: False if the pixel type is not supported.
+    """
+    height = frame.height * framebundlenum * viewnum
+
+    if frame.type == DCAM_PIXELTYPE.MONO16:
+        ctype = c_uint16
+    elif frame.type == DCAM_PIXELTYPE.MONO8:
+        ctype = c_uint8
+    else:
+        return False
+
+    pitch = frame.rowbytes // sizeof(ctype)
+    npBuf = np.ctypeslib.as_array(cast(frame.buf, POINTER(ctype)), shape=(height, pitch))
+    return npBuf[:, :frame.width]
+
+
 # ==== declare Dcamapi class ====
 
 
@@ -185,6 +215,8 @@ class Dcam:
         self.__hdcam = 0
         self.__hdcamwait = 0
         self.__bufframe = DCAMBUF_FRAME()
+        self.__framebundlenum = 1
+        self.__viewnum = 1
 
     def __repr__(self):
         return 'Dcam()'
@@ -502,7 +534,49 @@ class Dcam:
         if ret is False:
             return False
 
-        return self.__result(dcammisc_setupframe(self.__hdcam, self.__bufframe))
+        ret = self.__result(dcammisc_setupframe(self.__hdcam, self.__bufframe))
+        if ret is False:
+            return False
+
+        return self.__setup_frameinfo()
+
+    def __setup_frameinfo(self):
+        """Cache frame bundle and view numbers.
+
+        Internal use. Query FRAMEBUNDLE and NUMBEROF_VIEW once per allocated buffer,
+        so the per-frame functions do not need to access properties again.
+
+        Returns:
+            bool: True if the information was cached. False if error happened. lasterr() returns the DCAMERR value.
+        """
+        self.__framebundlenum = 1
+        self.__viewnum = 1
+
+        fValue = c_double()
+        err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.FRAMEBUNDLE_MODE, byref(fValue))
+        if not err.is_failed() and int(fValue.value) == DCAMPROP.MODE.ON:
+            err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.FRAMEBUNDLE_NUMBER, byref(fValue))
+            if err.is_failed():
+                return self.__result(err)
+            self.__framebundlenum = int(fValue.value)
+
+        err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.NUMBEROF_VIEW, byref(fValue))
+        if not err.is_failed():
+            self.__viewnum = int(fValue.value)
+
+        return True
+
+    def buf_getframeshape(self):
+        """Return shape of one transferred frame.
+
+        Return shape of the image data returned by buf_getframe() with the geometry
+        cached by buf_alloc(). Frame bundles and views are stacked vertically.
+
+        Returns:
+            (height, width): Number of rows and columns.
+        """
+        height = self.__bufframe.height * self.__framebundlenum * self.__viewnum
+        return (height, self.__bufframe.width)
 
     def buf_release(self):
         """Release DCAM internal buffer.
@@ -532,34 +606,44 @@ class Dcam:
         """
         if not self.is_opened():
             return self.__result(DCAMERR.INVALIDHANDLE)  # instance is not opened yet.
-        
-        framebundlenum = 1
-
-        fValue = c_double()
-        err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.FRAMEBUNDLE_MODE, byref(fValue))
-        if not err.is_failed() and int(fValue.value) == DCAMPROP.MODE.ON:
-            err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.FRAMEBUNDLE_NUMBER, byref(fValue))
-            if not err.is_failed():
-                framebundlenum = int(fValue.value)
-            else:
-                return False
-
-        viewnum = 1 
-        
-        err = dcamprop_getvalue(self.__hdcam, DCAM_IDPROP.NUMBEROF_VIEW, byref(fValue))
-        if not err.is_failed():
-            viewnum = int(fValue.value)
 
-        npBuf = dcammisc_alloc_ndarray(self.__bufframe, framebundlenum, viewnum)
+        npBuf = dcammisc_alloc_ndarray(self.__bufframe, self.__framebundlenum, self.__viewnum)
         
         if npBuf is False:
             return self.__result(DCAMERR.INVALIDPIXELTYPE)
 
+        aFrame = self.buf_copyframe(iFrame, npBuf)
+        if aFrame is False:
+            return False
+
+        return (aFrame, npBuf)
+
+    def buf_copyframe(self, iFrame, npBuf):
+        """Copy image data into a caller-provided NumPy buffer.
+
+        Copy image data specified by iFrame into npBuf without allocating memory.
+        npBuf must have the shape returned by buf_getframeshape(), the pixel type
+        of the frame and contiguous rows (a row stride larger than the width is allowed).
+
+        Args:
+            iFrame (int): Index of target frame.
+            npBuf (NumPy ndarray): Destination buffer.
+
+        Returns:
+            DCAMBUF_FRAME: Frame information (timestamp, framestamp) of the copied frame.
+            bool: False if error happens. lasterr() returns the DCAMERR value.
+        """
+        if not self.is_opened():
+            return self.__result(DCAMERR.INVALIDHANDLE)  # instance is not opened yet.
+
+        if npBuf.shape != self.buf_getframeshape() or npBuf.strides[1] != npBuf.itemsize:
+            return self.__result(DCAMERR.INVALIDPARAM)
+
         aFrame = DCAMBUF_FRAME()
         aFrame.iFrame = iFrame
 
         aFrame.buf = npBuf.ctypes.data_as(c_void_p)
-        aFrame.rowbytes = self.__bufframe.rowbytes
+        aFrame.rowbytes = npBuf.strides[0]
         aFrame.type = self.__bufframe.type
         aFrame.width = self.__bufframe.width
         aFrame.height = self.__bufframe.height
@@ -568,6 +652,36 @@ class Dcam:
         if ret is False:
             return False
 
+        return aFrame
+
+    def buf_lockframe(self, iFrame):
+        """Return DCAMBUF_FRAME instance and a view on the DCAM buffer.
+
+        Lock the frame specified by iFrame and return a NumPy view on the memory
+        owned by DCAM. No image data is copied, but the view is only valid until
+        DCAM overwrites that buffer or buf_release() is called.
+
+        Arg:
+            iFrame (int): Index of target frame.
+
+        Returns:
+            (aFrame, npBuf): aFrame is DCAMBUF_FRAME, npBuf is NumPy view.
+            bool: False if error happens. lasterr() returns the DCAMERR value.
+        """
+        if not self.is_opened():
+            return self.__result(DCAMERR.INVALIDHANDLE)  # instance is not opened yet.
+
+        aFrame = DCAMBUF_FRAME()
+        aFrame.iFrame = iFrame
+
+        ret = self.__result(dcambuf_lockframe(self.__hdcam, byref(aFrame)))
+        if ret is False:
+            return False
+
+        npBuf = dcammisc_view_ndarray(aFrame, self.__framebundlenum, self.__viewnum)
+        if npBuf is False:
+            return self.__result(DCAMERR.INVALIDPIXELTYPE)
+
         return (aFrame, npBuf)
 
     def buf_getframedata(self, iFrame):
@@ -3,6 +3,7 @@
 # Copyright (C) 2021-2022 Hamamatsu Photonics K.K.. All right reserved.
 
 
+import os
 import platform
 from enum import IntEnum
 from ctypes import *
@@ -13,7 +14,10 @@ from ctypes import *
 # abosorb platform dependency
 
 __platform_system = platform.system()
-if __platform_system == 'Windows':
+if os.environ.get('DCAMAPI_SIMULATOR','0') == '1':
+    # pure python stand-in for the DCAM library, see dcamsim.py
+    from . import dcamsim as __dll
+elif __platform_system == 'Windows':
     __dll = windll.LoadLibrary('dcamapi.dll')
 else:  # Linux
     __dll = cdll.LoadLibrary('/usr/local/lib/libdcamapi.so')
@@ -0,0 +1,668 @@
+"""Simulated DCAM-API function table.
+
+Pure Python stand-in for the functions that dcamapi4 binds from the DCAM
+shared library, so HamamatsuCamera (and its Dcam wrapper) can run without a
+camera or driver. It is selected by dcamapi4 when the environment variable
+DCAMAPI_SIMULATOR=1 is set before the module is imported.
+
+The simulated camera runs on the internal trigger only. A frame is produced
+every max(exposure, readout) seconds after a start latency and becomes
+available a transfer latency after the end of its exposure. Frames are only
+rendered when the application asks for them (wait, transferinfo, copyframe),
+so no background thread is needed. The pixel data of frame k is a fixed
+pattern plus (k % 256), which makes dropped or reordered frames easy to spot.
+
+The model is configured with SIM_CONFIG, either directly or by environment
+variables named DCAMSIM_<KEY> (e.g. DCAMSIM_LINE_TIME_US=4.87).
+"""
+
+import os
+import threading
+from time import perf_counter, sleep, time
+
+import numpy as np
+from ctypes import POINTER, c_uint8, c_uint16, cast
+
+############################################################################### Configuration
+
+SIM_CONFIG = {
+    'device_count'       : 1,
+    'vendor'             : 'HAMAMATSU',
+    'model'              : 'C13440-20C (simulated)',
+    'camera_id'          : 'S/N: 000000',
+    'width'              : 2048,
+    'height'             : 2048,
+    'line_time_us'       : 4.87,   # row readout time, sets the minimal frame period
+    'start_latency_ms'   : 20.0,   # between dcamcap_start and the first exposure
+    'transfer_latency_ms': 1.0,    # between the end of the exposure and FRAMEREADY
+    'exposure_min_s'     : 1e-5,
+    'exposure_max_s'     : 10.0,
+    'background'         : 100,
+    'seed'               : 0,
+}
+
+for _key,_value in SIM_CONFIG.items():
+    _env = os.environ.get('DCAMSIM_'+_key.upper())
+    if _env is not None:
+        SIM_CONFIG[_key] = type(_value)(_env)
+
+# Offset to convert perf_counter() into the epoch, used for the frame timestamps
+_EPOCH_OFFSET = time() - perf_counter()
+
+# The simulator is imported by dcamapi4 while it is being loaded, so the
+# DCAM constants are looked up on first use.
+_api = None
+
+def _dcam():
+    global _api
+    if _api is None:
+        from . import dcamapi4 as _api
+    return _api
+
+def _obj(arg):
+    # Unwrap byref() arguments
+    return getattr(arg,'_obj',arg)
+
+def _val(arg):
+    # Unwrap ctypes simple values
+    return getattr(arg,'value',arg)
+
+############################################################################### Simulated device
+
+class _SimDevice:
+
+    def __init__(self,index):
+        api  = _dcam()
+        P    = api.DCAM_IDPROP
+        ON   = api.DCAMPROP.MODE.ON
+        OFF  = api.DCAMPROP.MODE.OFF
+        W,H  = SIM_CONFIG['width'],SIM_CONFIG['height']
+
+        self.index = index
+        self.lock  = threading.RLock()
+
+        # Writable properties and their (min,max,busy_writable)
+        self.props = {
+            P.IMAGE_PIXELTYPE    : float(api.DCAM_PIXELTYPE.MONO16),
+            P.EXPOSURETIME       : 0.1,
+            P.SENSORCOOLER       : float(ON),
+            P.SUBARRAYMODE       : float(OFF),
+            P.SUBARRAYHPOS       : 0.0,
+            P.SUBARRAYVPOS       : 0.0,
+            P.SUBARRAYHSIZE      : float(W),
+            P.SUBARRAYVSIZE      : float(H),
+            P.FRAMEBUNDLE_MODE   : float(OFF),
+            P.FRAMEBUNDLE_NUMBER : 1.0,
+        }
+        self.ranges = {
+            P.IMAGE_PIXELTYPE    : (1,2,False),
+            P.EXPOSURETIME       : (SIM_CONFIG['exposure_min_s'],SIM_CONFIG['exposure_max_s'],True),
+            P.SENSORCOOLER       : (OFF,ON,True),
+            P.SUBARRAYMODE       : (OFF,ON,False),
+            P.SUBARRAYHPOS       : (0,W-4,False),
+            P.SUBARRAYVPOS       : (0,H-4,False),
+            P.SUBARRAYHSIZE      : (4,W,False),
+            P.SUBARRAYVSIZE      : (4,H,False),
+            P.FRAMEBUNDLE_MODE   : (OFF,ON,False),
+            P.FRAMEBUNDLE_NUMBER : (1,1024,False),
+        }
+        self.readonly = {
+            P.IMAGE_WIDTH          : lambda: self.width(),
+            P.IMAGE_HEIGHT         : lambda: self.height(),
+            P.IMAGE_ROWBYTES       : lambda: self.width()*self.pixel_bytes(),
+            P.IMAGE_FRAMEBYTES     : lambda: self.width()*self.pixel_bytes()*self.height(),
+            P.FRAMEBUNDLE_ROWBYTES : lambda: self.width()*self.pixel_bytes(),
+            P.NUMBEROF_VIEW        : lambda: 1,
+            P.TIMING_READOUTTIME   : lambda: self.readout_time(),
+            P.INTERNALFRAMERATE    : lambda: 1.0/self.image_period(),
+        }
+        self.mode_props = {P.SENSORCOOLER,P.SUBARRAYMODE,P.FRAMEBUNDLE_MODE}
+
+        self.buffer     = None
+        self.stamps     = np.zeros(0,np.float64)
+        self.framestamp = np.zeros(0,np.int64)
+        self.pattern    = None
+        self.capturing  = False
+        self.snap       = False
+        self.anchor_time  = 0.0
+        self.anchor_count = 0
+        self.n_rendered   = 0
+        self.session      = 0
+
+    ############################################################### Geometry
+
+    def _prop_int(self,idprop):
+        return int(self.props[idprop])
+
+    def _subarray_on(self):
+        return self._prop_int(_dcam().DCAM_IDPROP.SUBARRAYMODE) == _dcam().DCAMPROP.MODE.ON
+
+    def width(self):
+        P = _dcam().DCAM_IDPROP
+        if self._subarray_on():
+            return min(self._prop_int(P.SUBARRAYHSIZE),SIM_CONFIG['width']-self._prop_int(P.SUBARRAYHPOS))
+        return SIM_CONFIG['width']
+
+    def height(self):
+        P = _dcam().DCAM_IDPROP
+        if self._subarray_on():
+            return min(self._prop_int(P.SUBARRAYVSIZE),SIM_CONFIG['height']-self._prop_int(P.SUBARRAYVPOS))
+        return SIM_CONFIG['height']
+
+    def bundle(self):
+        P = _dcam().DCAM_IDPROP
+        if self._prop_int(P.FRAMEBUNDLE_MODE) == _dcam().DCAMPROP.MODE.ON:
+            return self._prop_int(P.FRAMEBUNDLE_NUMBER)
+        return 1
+
+    def dtype(self):
+        if self._prop_int(_dcam().DCAM_IDPROP.IMAGE_PIXELTYPE) == _dcam().DCAM_PIXELTYPE.MONO8:
+            return np.uint8
+        return np.uint16
+
+    def pixel_bytes(self):
+        return np.dtype(self.dtype()).itemsize
+
+    ################################################################# Timing
+
+    def readout_time(self):
+        return self.height()*SIM_CONFIG['line_time_us']*1e-6
+
+    def image_period(self):
+        return max(self.props[_dcam().DCAM_IDPROP.EXPOSURETIME],self.readout_time())
+
+    def frame_period(self):
+        # One transferred frame holds 'bundle' images
+        return self.bundle()*self.image_period()
+
+    def reanchor(self,now):
+        # Keep the frame count continuous when the period changes during capture
+        self.anchor_count = self.n_rendered
+        self.anchor_time  = now + self.frame_period() + 1e-3*SIM_CONFIG['transfer_latency_ms']
+
+    def frames_available(self,now):
+        if not self.capturing:
+            return self.n_rendered
+        n = self.anchor_count + int(np.floor((now-self.anchor_time)/self.frame_period())) + 1
+        n = max(n,self.anchor_count)
+        if self.snap:
+            n = min(n,len(self.buffer))
+        return n
+
+    def next_frame_time(self):
+        k = self.n_rendered - self.anchor_count
+        return self.anchor_time + k*self.frame_period()
+
+    def frame_timestamp(self,k):
+        # End of the exposure of frame k, in seconds since the epoch
+        t = self.anchor_time + (k-self.anchor_count)*self.frame_period() - 1e-3*SIM_CONFIG['transfer_latency_ms']
+        return t + _EPOCH_OFFSET
+
+    ############################################################## Rendering
+
+    def alloc(self,n_frames):
+        rows = self.height()*self.bundle()
+        cols = self.width()
+        rng  = np.random.default_rng(SIM_CONFIG['seed'])
+        ramp = np.linspace(0,64,cols,dtype=np.float32)[None,:] + np.linspace(0,64,rows,dtype=np.float32)[:,None]
+        pattern = SIM_CONFIG['background'] + ramp + rng.integers(0,32,(rows,cols))
+        if self.dtype() == np.uint8:
+            pattern /= 4
+        self.pattern    = pattern.astype(self.dtype())
+        self.buffer     = np.zeros((n_frames,rows,cols),self.dtype())
+        self.stamps     = np.zeros(n_frames,np.float64)
+        self.framestamp = np.full(n_frames,-1,np.int64)
+        self.n_rendered = 0
+
+    def release(self):
+        self.buffer  = None
+        self.pattern = None
+
+    def update(self,now=None):
+        if now is None:
+            now = perf_counter()
+        n = self.frames_available(now)
+        if n > self.n_rendered:
+            n_buf = len(self.buffer)
+            for k in range(max(self.n_rendered,n-n_buf),n):
+                slot = k % n_buf
+                np.add(self.pattern,k%256,out=self.buffer[slot],casting='unsafe')
+                self.stamps[slot]     = self.frame_timestamp(k)
+                self.framestamp[slot] = k
+            self.n_rendered = n
+        if self.snap and self.capturing and self.n_rendered >= len(self.buffer):
+            self.capturing = False
+
+    def slot_index(self,iFrame):
+        # Resolve -1 (newest) and check the frame was captured
+        if self.n_rendered == 0:
+            return None
+        if iFrame < 0:
+            return (self.n_rendered-1) % len(self.buffer)
+        if iFrame >= len(self.buffer) or iFrame >= self.n_rendered:
+            return None
+        return iFrame
+
+    def fill_frame(self,frame,slot):
+        ts = self.stamps[slot]
+        frame.timestamp.sec      = int(ts)
+        frame.timestamp.microsec = int(1e6*(ts-int(ts)))
+        frame.framestamp = int(self.framestamp[slot])
+        frame.left  = 0
+        frame.top   = 0
+        if self._subarray_on():
+            P = _dcam().DCAM_IDPROP
+            frame.left = self._prop_int(P.SUBARRAYHPOS)
+            frame.top  = self._prop_int(P.SUBARRAYVPOS)
+
+_devices = {}
+_waiters = {}
+_HANDLE_BASE = 0x5100
+
+def _device(hdcam):
+    return _devices.get(_val(hdcam))
+
+############################################################################### dcamapi
+
+def dcamapi_init(param):
+    param = _obj(param)
+    param.iDeviceCount = SIM_CONFIG['device_count']
+    return _dcam().DCAMERR.SUCCESS
+
+def dcamapi_uninit():
+    _devices.clear()
+    _waiters.clear()
+    return _dcam().DCAMERR.SUCCESS
+
+############################################################################### dcamdev
+
+def dcamdev_open(param):
+    api = _dcam()
+    param = _obj(param)
+    if not 0 <= param.index < SIM_CONFIG['device_count']:
+        return api.DCAMERR.NOCAMERA
+    handle = _HANDLE_BASE + param.index
+    if handle in _devices:
+        return api.DCAMERR.EXCLUDED
+    _devices[handle] = _SimDevice(param.index)
+    param.hdcam = handle
+    return api.DCAMERR.SUCCESS
+
+def dcamdev_close(hdcam):
+    dev = _devices.pop(_val(hdcam),None)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    dev.capturing = False
+    return _dcam().DCAMERR.SUCCESS
+
+def dcamdev_getstring(hdcam,param):
+    api   = _dcam()
+    param = _obj(param)
+    texts = {
+        api.DCAM_IDSTR.BUS               : 'SIMULATOR',
+        api.DCAM_IDSTR.CAMERAID          : SIM_CONFIG['camera_id'],
+        api.DCAM_IDSTR.VENDOR            : SIM_CONFIG['vendor'],
+        api.DCAM_IDSTR.MODEL             : SIM_CONFIG['model'],
+        api.DCAM_IDSTR.CAMERAVERSION     : '0.0',
+        api.DCAM_IDSTR.DRIVERVERSION     : '0.0',
+        api.DCAM_IDSTR.MODULEVERSION     : '0.0',
+        api.DCAM_IDSTR.DCAMAPIVERSION    : '4.00',
+        api.DCAM_IDSTR.CAMERA_SERIESNAME : 'ORCA',
+    }
+    if param.iString not in texts:
+        return api.DCAMERR.UNKNOWNSTRID
+    param._textbuf.value = texts[param.iString].encode()[:param.textbytes-1]
+    return api.DCAMERR.SUCCESS
+
+############################################################################### dcamprop
+
+def dcamprop_getattr(hdcam,param):
+    api   = _dcam()
+    dev   = _device(hdcam)
+    param = _obj(param)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    A = api.DCAM_PROP.ATTR
+    idprop = param.iProp
+    if idprop in dev.ranges:
+        vmin,vmax,busy = dev.ranges[idprop]
+        attribute = A.READABLE | A.WRITABLE | A.ACCESSREADY | A.EFFECTIVE | A.HASRANGE
+        if busy:
+            attribute |= A.ACCESSBUSY
+        param.valuemin     = vmin
+        param.valuemax     = vmax
+        param.valuedefault = dev.props[idprop]
+    elif idprop in dev.readonly:
+        attribute = A.READABLE | A.ACCESSREADY | A.ACCESSBUSY | A.EFFECTIVE | A.VOLATILE
+    else:
+        return api.DCAMERR.INVALIDPROPERTYID
+    param.attribute = int(attribute)
+    param.nMaxView  = 1
+    return api.DCAMERR.SUCCESS
+
+def dcamprop_getvalue(hdcam,idprop,value):
+    api = _dcam()
+    dev = _device(hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    idprop = _val(idprop)
+    with dev.lock:
+        if idprop in dev.props:
+            _obj(value).value = dev.props[idprop]
+        elif idprop in dev.readonly:
+            _obj(value).value = dev.readonly[idprop]()
+        else:
+            return api.DCAMERR.INVALIDPROPERTYID
+    return api.DCAMERR.SUCCESS
+
+def _checkvalue(dev,idprop,value):
+    api = _dcam()
+    if idprop in dev.readonly:
+        return api.DCAMERR.NOTWRITABLE,value
+    if idprop not in dev.ranges:
+        return api.DCAMERR.INVALIDPROPERTYID,value
+    vmin,vmax,busy = dev.ranges[idprop]
+    if dev.capturing and not busy:
+        return api.DCAMERR.BUSY,value
+    if idprop in dev.mode_props and int(value) not in (vmin,vmax):
+        return api.DCAMERR.INVALIDVALUE,value
+    if idprop != api.DCAM_IDPROP.EXPOSURETIME:
+        value = float(int(value))
+    return api.DCAMERR.SUCCESS,min(max(value,vmin),vmax)
+
+def _setvalue(dev,idprop,value):
+    err,value = _checkvalue(dev,idprop,value)
+    if err.is_failed():
+        return err,value
+    with dev.lock:
+        if dev.capturing and idprop == _dcam().DCAM_IDPROP.EXPOSURETIME:
+            now = perf_counter()
+            dev.update(now)
+            dev.props[idprop] = value
+            dev.reanchor(now)
+        else:
+            dev.props[idprop] = value
+    return err,value
+
+def dcamprop_setvalue(hdcam,idprop,value):
+    dev = _device(hdcam)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    err,_ = _setvalue(dev,_val(idprop),float(_val(value)))
+    return err
+
+def dcamprop_setgetvalue(hdcam,idprop,value,option=0):
+    dev = _device(hdcam)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    value = _obj(value)
+    err,actual = _setvalue(dev,_val(idprop),float(value.value))
+    if not err.is_failed():
+        value.value = actual
+    return err
+
+def dcamprop_queryvalue(hdcam,idprop,value,option=0):
+    dev = _device(hdcam)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    value = _obj(value)
+    idprop = _val(idprop)
+    if idprop in dev.ranges:
+        vmin,vmax,_ = dev.ranges[idprop]
+        value.value = min(max(value.value,vmin),vmax)
+        return _dcam().DCAMERR.SUCCESS
+    return _dcam().DCAMERR.INVALIDPROPERTYID
+
+def dcamprop_getnextid(hdcam,idprop,option=0):
+    dev = _device(hdcam)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    idprop = _obj(idprop)
+    ids = sorted(int(i) for i in list(dev.props)+list(dev.readonly) if int(i) > idprop.value)
+    if not ids:
+        return _dcam().DCAMERR.NOPROPERTY
+    idprop.value = ids[0]
+    return _dcam().DCAMERR.SUCCESS
+
+def dcamprop_getname(hdcam,idprop,text,textbytes):
+    api = _dcam()
+    try:
+        name = api.DCAM_IDPROP(_val(idprop)).name
+    except ValueError:
+        return api.DCAMERR.INVALIDPROPERTYID
+    text.value = name.encode()[:_val(textbytes)-1]
+    return api.DCAMERR.SUCCESS
+
+def dcamprop_getvaluetext(hdcam,param):
+    api   = _dcam()
+    dev   = _device(hdcam)
+    param = _obj(param)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if param.iProp in dev.mode_props:
+        text = api.DCAMPROP.MODE(int(param.value)).name
+    elif param.iProp == api.DCAM_IDPROP.IMAGE_PIXELTYPE:
+        text = api.DCAM_PIXELTYPE(int(param.value)).name
+    else:
+        return api.DCAMERR.NOVALUETEXT
+    param._textbuf.value = text.encode()[:param.textbytes-1]
+    return api.DCAMERR.SUCCESS
+
+############################################################################### dcambuf
+
+def dcambuf_alloc(hdcam,n_frames):
+    api = _dcam()
+    dev = _device(hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    n_frames = int(_val(n_frames))
+    if n_frames < 1:
+        return api.DCAMERR.INVALIDPARAM
+    if dev.capturing:
+        return api.DCAMERR.BUSY
+    with dev.lock:
+        dev.alloc(n_frames)
+    return api.DCAMERR.SUCCESS
+
+def dcambuf_release(hdcam,option=0):
+    api = _dcam()
+    dev = _device(hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if dev.capturing:
+        return api.DCAMERR.BUSY
+    with dev.lock:
+        dev.release()
+    return api.DCAMERR.SUCCESS
+
+def dcambuf_lockframe(hdcam,frame):
+    api   = _dcam()
+    dev   = _device(hdcam)
+    frame = _obj(frame)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if dev.buffer is None:
+        return api.DCAMERR.NOTREADY
+    with dev.lock:
+        dev.update()
+        slot = dev.slot_index(frame.iFrame)
+        if slot is None:
+            return api.DCAMERR.INVALIDFRAMEINDEX
+        data = dev.buffer[slot]
+        frame.buf      = data.ctypes.data
+        frame.rowbytes = data.strides[0]
+        frame.type     = int(api.DCAM_PIXELTYPE.MONO8 if data.dtype == np.uint8 else api.DCAM_PIXELTYPE.MONO16)
+        frame.width    = data.shape[1]
+        frame.height   = data.shape[0]//dev.bundle()
+        dev.fill_frame(frame,slot)
+    return api.DCAMERR.SUCCESS
+
+def dcambuf_copyframe(hdcam,frame):
+    api   = _dcam()
+    dev   = _device(hdcam)
+    frame = _obj(frame)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if dev.buffer is None:
+        return api.DCAMERR.NOTREADY
+    with dev.lock:
+        dev.update()
+        slot = dev.slot_index(frame.iFrame)
+        if slot is None:
+            return api.DCAMERR.INVALIDFRAMEINDEX
+        data = dev.buffer[slot]
+        if not frame.buf or frame.width != data.shape[1] or frame.height*dev.bundle() != data.shape[0]:
+            return api.DCAMERR.INVALIDPARAM
+        ctype = c_uint8 if data.dtype == np.uint8 else c_uint16
+        pitch = frame.rowbytes // data.itemsize
+        dst   = np.ctypeslib.as_array(cast(frame.buf,POINTER(ctype)),shape=(data.shape[0],pitch))
+        np.copyto(dst[:,:data.shape[1]],data)
+        dev.fill_frame(frame,slot)
+    return api.DCAMERR.SUCCESS
+
+############################################################################### dcamcap
+
+def dcamcap_start(hdcam,mode):
+    api = _dcam()
+    dev = _device(hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if dev.buffer is None:
+        return api.DCAMERR.NOTREADY
+    if dev.capturing:
+        return api.DCAMERR.BUSY
+    with dev.lock:
+        dev.snap         = int(_val(mode)) == api.DCAMCAP_START.SNAP
+        dev.session     += 1
+        dev.n_rendered   = 0
+        dev.anchor_count = 0
+        dev.anchor_time  = perf_counter() + 1e-3*(SIM_CONFIG['start_latency_ms']+SIM_CONFIG['transfer_latency_ms']) + dev.frame_period()
+        dev.capturing    = True
+    return api.DCAMERR.SUCCESS
+
+def dcamcap_stop(hdcam):
+    dev = _device(hdcam)
+    if dev is None:
+        return _dcam().DCAMERR.INVALIDHANDLE
+    with dev.lock:
+        if dev.capturing:
+            dev.update()
+        dev.capturing = False
+    return _dcam().DCAMERR.SUCCESS
+
+def dcamcap_status(hdcam,status):
+    api = _dcam()
+    dev = _device(hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    with dev.lock:
+        if dev.capturing:
+            dev.update()
+        if dev.capturing:
+            value = api.DCAMCAP_STATUS.BUSY
+        elif dev.buffer is not None:
+            value = api.DCAMCAP_STATUS.READY
+        else:
+            value = api.DCAMCAP_STATUS.STABLE
+    _obj(status).value = int(value)
+    return api.DCAMERR.SUCCESS
+
+def dcamcap_transferinfo(hdcam,param):
+    api   = _dcam()
+    dev   = _device(hdcam)
+    param = _obj(param)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+    if dev.buffer is None:
+        return api.DCAMERR.NOTREADY
+    with dev.lock:
+        dev.update()
+        param.nFrameCount       = dev.n_rendered
+        param.nNewestFrameIndex = (dev.n_rendered-1) % len(dev.buffer) if dev.n_rendered > 0 else -1
+    return api.DCAMERR.SUCCESS
+
+def dcamcap_firetrigger(hdcam,option=0):
+    # Only the internal trigger is simulated
+    return _dcam().DCAMERR.NOTSUPPORT
+
+def dcamcap_record(hdcam,hrec):
+    return _dcam().DCAMERR.NOTSUPPORT
+
+############################################################################### dcamwait
+
+class _SimWaiter:
+    def __init__(self,hdcam):
+        self.hdcam   = hdcam
+        self.seen    = 0
+        self.session = 0
+        self.aborted = False
+
+def dcamwait_open(param):
+    api   = _dcam()
+    param = _obj(param)
+    if _device(param.hdcam) is None:
+        return api.DCAMERR.INVALIDHANDLE
+    handle = _HANDLE_BASE + 0x100 + len(_waiters)
+    while handle in _waiters:
+        handle += 1
+    _waiters[handle] = _SimWaiter(param.hdcam)
+    param.hwait        = handle
+    param.supportevent = int(api.DCAMWAIT_CAPEVENT.FRAMEREADY | api.DCAMWAIT_CAPEVENT.STOPPED)
+    return api.DCAMERR.SUCCESS
+
+def dcamwait_close(hwait):
+    if _waiters.pop(_val(hwait),None) is None:
+        return _dcam().DCAMERR.INVALIDWAITHANDLE
+    return _dcam().DCAMERR.SUCCESS
+
+def dcamwait_start(hwait,param):
+    api    = _dcam()
+    waiter = _waiters.get(_val(hwait))
+    param  = _obj(param)
+    if waiter is None:
+        return api.DCAMERR.INVALIDWAITHANDLE
+    dev = _device(waiter.hdcam)
+    if dev is None:
+        return api.DCAMERR.INVALIDHANDLE
+
+    waiter.aborted = False
+    deadline = perf_counter() + 1e-3*param.timeout
+    while True:
+        with dev.lock:
+            if dev.buffer is not None:
+                was_capturing = dev.capturing
+                dev.update()
+                if waiter.session != dev.session:
+                    waiter.session = dev.session  # a new capture was started
+                    waiter.seen    = 0
+                if dev.n_rendered > waiter.seen and param.eventmask & api.DCAMWAIT_CAPEVENT.FRAMEREADY:
+                    waiter.seen = dev.n_rendered
+                    param.eventhappened = int(api.DCAMWAIT_CAPEVENT.FRAMEREADY)
+                    return api.DCAMERR.SUCCESS
+                if was_capturing and not dev.capturing and param.eventmask & api.DCAMWAIT_CAPEVENT.STOPPED:
+                    param.eventhappened = int(api.DCAMWAIT_CAPEVENT.STOPPED)
+                    return api.DCAMERR.SUCCESS
+            next_time = dev.next_frame_time() if dev.capturing else deadline
+
+        now = perf_counter()
+        if waiter.aborted:
+            return api.DCAMERR.ABORT
+        if now >= deadline:
+            return api.DCAMERR.TIMEOUT
+        # Sleep in short steps so dcamwait_abort is honoured quickly
+        sleep(min(max(next_time-now,0),deadline-now,0.01))
+
+def dcamwait_abort(hwait):
+    waiter = _waiters.get(_val(hwait))
+    if waiter is None:
+        return _dcam().DCAMERR.INVALIDWAITHANDLE
+    waiter.aborted = True
+    return _dcam().DCAMERR.SUCCESS
+
+############################################################################### dcamrec
+
+def dcamrec_openW(param):
+    return _dcam().DCAMERR.NOTSUPPORT
+
+def dcamrec_close(hrec):
+    return _dcam().DCAMERR.NOTSUPPORT
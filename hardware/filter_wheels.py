@@ -28,7 +28,8 @@ class DummyFilterWheel(Device):
 
     @pyqtSlot(int)
     def set_position(self,pos:int):
-        self.num_pos = min(max(pos,0),self.num_pos)
+        self.pos = min(max(pos,0),self.num_pos)
+        self.state_changed()
         print(f'[{self.thread_id}] {self.full_name}: set_position({pos})')
         
     def get_position(self) -> int:
@@ -74,9 +75,11 @@ class ThorlabsFilterWheel(Device):
     def set_position(self,pos:int):
         self.pos = min(max(pos,0),self.num_pos)
         self.filterwheel.position = self.pos
+        self.state_changed()
         
     def get_position(self) -> int:
         self.pos = self.filterwheel.position
+        self.state_changed()
         return self.pos
 
     
@@ -21,6 +21,8 @@ class DummyLaser(Device):
 
         self.power_ratio       = 0.0
         self.power_ratio_range = (0.0,1.0)
+        self.power_value       = 0.0 # ratio in percent, for the saved metadata
+        self.power_value_unit  = '%'
         
     def free(self):
         self.set_power_ratio (None,0.0)
@@ -32,6 +34,8 @@ class DummyLaser(Device):
     @pyqtSlot(int,float)
     def set_power_ratio(self,_subdevice_id:int,ratio:float):
         self.power_ratio = min(max(ratio,self.power_ratio_range[0]),self.power_ratio_range[1])
+        self.power_value = 100.0*self.power_ratio
+        self.state_changed()
         print(f'[{self.thread_id}] {self.full_name}: set_power_ratio({ratio})')
         
     def get_power_ratio(self,_subdevice_id:int) -> float:
@@ -43,6 +47,7 @@ class DummyLaser(Device):
     @pyqtSlot(int,bool)
     def set_power_status(self,_subdevice_id:int,status:bool):
         self.power_status = status
+        self.state_changed()
         on_or_off = 'on' if self.power_status else 'off'
         print(f'[{self.thread_id}] {self.full_name}: set_power_status({status}) [{on_or_off}]')
         
@@ -85,6 +90,7 @@ class TopticaIBeamLaser(Device):
     @pyqtSlot(int,float)
     def set_power_value(self,_subdevice:int,value:float):
         self.power_value = min(max(value,self.power_value_range[0]),self.power_value_range[1])
+        self.state_changed()
         self.iBeam._conn.command(b"channel 1 power %f" % (self.power_value))
     
     def get_power_value(self,_subdevice_id:int) -> float:
@@ -95,6 +101,7 @@ class TopticaIBeamLaser(Device):
     @pyqtSlot(int,bool)
     def set_power_status(self,_subdevice_id:int,status:bool):
         self.power_status = status
+        self.state_changed()
         if self.power_status:
             self.iBeam.enable()
         else:
@@ -153,6 +160,7 @@ class OmicronLaser_PycroManager(Device):
     @pyqtSlot(int,float)
     def set_power_value(self,_subdevice_id:int,value:float):
         self.power_value = min(max(value,self.power_value_range[0]),self.power_value_range[1])
+        self.state_changed()
         self.mmcore.set_property('Omicron USB','Power Setpoint', self.power_value)
         
     def get_power_value(self,_subdevice_id:int) -> float:
@@ -163,6 +171,7 @@ class OmicronLaser_PycroManager(Device):
     @pyqtSlot(int,bool)
     def set_power_status(self,_subdevice_id:int,status:bool):
         self.power_status = status
+        self.state_changed()
         on_or_off = 'On' if self.power_status else 'Off'
         self.mmcore.set_property('Omicron USB','Power',on_or_off)
     
@@ -216,6 +225,7 @@ class MicroFPGALaser(Device):
     @pyqtSlot(int,float)
     def set_power_value(self,subdevice_id:int,value:float):
         self.power_value[subdevice_id] = min(max(value,self.power_value_range[subdevice_id][0]),self.power_value_range[subdevice_id][1])
+        self.state_changed()
         uint8_value = int( np.round(255.0*self.power_value[subdevice_id])/100.0 )
         self._ufpga.set_pwm_state(self.channels_conf[subdevice_id]['pwm'],uint8_value)
         
@@ -228,6 +238,7 @@ class MicroFPGALaser(Device):
     def set_power_status(self,subdevice_id:int,status:bool):
         print('sup: ',status)
         self.power_status[subdevice_id] = status
+        self.state_changed()
         on_or_off = _mode.MODE_ON if self.power_status[subdevice_id] else _mode.MODE_OFF
         self._ufpga._lasers[self.channels_conf[subdevice_id]['laser']].set_mode(on_or_off)
         
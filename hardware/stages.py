@@ -16,9 +16,9 @@ class DummyStage(Device):
         self.axis_z = self.axis_dict['z']
         self.show_commands = True
         
-        self.x_steps = 0
-        self.y_steps = 0
-        self.z_steps = 0
+        self.step_counter   = {'x':0,'y':0,'z':0}
+        self.offset_tracker = {'x':0,'y':0,'z':0}
+        self.init_voltage_offset = 65
         
     def free(self):
         self.set_mode_ground()
@@ -37,9 +37,10 @@ class DummyStage(Device):
         self.set_configuration(self.init_voltage_offset)
     
     def set_position_counter(self,x=0,y=0,z=0):
-        self.x_steps = x
-        self.y_steps = y
-        self.z_steps = z
+        self.step_counter['x'] = x
+        self.step_counter['y'] = y
+        self.step_counter['z'] = z
+        self.state_changed()
     
     @pyqtSlot(int,int)
     def set_voltage(self,axis_id,volt_value):
@@ -85,18 +86,27 @@ class DummyStage(Device):
     def positioning_coarse(self,axis_id,is_up,n_steps):
         axis_name = list( self.axis_dict.keys() )[ list(self.axis_dict.values()).index(axis_id) ]
         if is_up:
-            print(f'[{self.thread_id}] {self.full_name}: step_up({axis_id},{n_steps})')
+            if self.show_commands:
+                print(f'[{self.thread_id}] {self.full_name}: step_up({axis_id},{n_steps})')
             self.step_counter[axis_name] = self.step_counter[axis_name] + int(n_steps)
         else:
-            print(f'[{self.thread_id}] {self.full_name}: step_down({axis_id},{n_steps})')
+            if self.show_commands:
+                print(f'[{self.thread_id}] {self.full_name}: step_down({axis_id},{n_steps})')
             self.step_counter[axis_name] = self.step_counter[axis_name] - int(n_steps)
+        self.state_changed()
 
     @pyqtSlot(int,float)
     def positioning_fine_delta(self,axis_id,delta_voltage):
-        print(f'[{self.thread_id}] {self.full_name}: delta_pos({axis_id},{delta_voltage})')
+        axis_name = list( self.axis_dict.keys() )[ list(self.axis_dict.values()).index(axis_id) ]
+        self.offset_tracker[axis_name] = max(self.offset_tracker[axis_name] + delta_voltage,0)
+        if self.show_commands:
+            print(f'[{self.thread_id}] {self.full_name}: delta_pos({axis_id},{delta_voltage})')
     
     def positioning_fine_absolute(self,axis_id,voltage):
-        print(f'[{self.thread_id}] {self.full_name}: set_pos({axis_id},{voltage})')
+        axis_name = list( self.axis_dict.keys() )[ list(self.axis_dict.values()).index(axis_id) ]
+        self.offset_tracker[axis_name] = voltage
+        if self.show_commands:
+            print(f'[{self.thread_id}] {self.full_name}: set_pos({axis_id},{voltage})')
         
     def wait_axis(self,axis_id):
         sleep(0.05)
@@ -146,6 +156,7 @@ class AttoCubeStage(Device):
         self.step_counter['x'] = x
         self.step_counter['y'] = y
         self.step_counter['z'] = z
+        self.state_changed()
     
     def _send_command(self,command):
         self.com.write( command.encode('ascii') )
@@ -247,6 +258,7 @@ class AttoCubeStage(Device):
         else:
             self._send_command( f'stepd {int(axis_id)} {int(n_steps)}\r\n' )
             self.step_counter[axis_name] = self.step_counter[axis_name] - int(n_steps)
+        self.state_changed()
         self.wait_axis(axis_id)
         self.is_busy = False
         
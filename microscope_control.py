@@ -2,6 +2,7 @@ import os
 os.environ["KMP_DUPLICATE_LIB_OK"]="TRUE"
 
 import sys
+from time import perf_counter
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QSplashScreen
 from PyQt5.QtWidgets import QMessageBox, QSplitter, QGroupBox, QTabWidget
 from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QGridLayout, QFormLayout
@@ -10,21 +11,52 @@ from PyQt5.QtWidgets import QFileDialog,QTableWidget,QHeaderView,QTableWidgetIte
 from PyQt5.QtCore import Qt, pyqtSlot, pyqtSignal, QSettings, QByteArray, QTimer
 from PyQt5.QtGui import QIcon
 
-from hardware import DeviceManager
+from os.path import join,normpath
+
+import numpy as np
+
+import qtmodern.styles
+
+########################################################### Splash screen before the project imports
+
+app = QApplication.instance()  # Check if QApplication is already running
+if not app:  
+    app = QApplication(sys.argv)
+qtmodern.styles.dark(app)
+app.setKeyboardInputInterval(60)
+app.setWindowIcon( QIcon('resources/microscope.svg') )
+
+#splash = QSplashScreen(flags=Qt.WindowStaysOnTopHint)
+splash = QSplashScreen()
+splash.showMessage("Starting...", Qt.AlignBottom | Qt.AlignCenter, Qt.white)
+splash.show()
+
+# Import-time profile, use 'python -X importtime microscope_control.py' for the details.
+# core (numba) goes first, gui imports it and would otherwise be charged for it.
+import_profile = []
+t_import = perf_counter()
+splash.showMessage("Importing processing core...", Qt.AlignTop| Qt.AlignLeft, Qt.white)
+from core import Worker, ZLock, warmup_kernels
+import_profile.append( ('core',perf_counter()-t_import) )
+
+t_import = perf_counter()
+splash.showMessage("Importing hardware drivers...", Qt.AlignTop| Qt.AlignLeft, Qt.white)
+from hardware import DeviceManager,DeviceLoader
 from hardware import DummyLaser,MicroFPGALaser,TopticaIBeamLaser #,OmicronLaser_PycroManager
 from hardware import ThorlabsFilterWheel, DummyFilterWheel
 from hardware import AttoCubeStage, DummyStage
-from hardware import HamamatsuCamera,PySpinCamera,DummyCamera
+from hardware import HamamatsuCamera,PySpinCamera,DummyCamera,DummyBeadCamera
+import_profile.append( ('hardware',perf_counter()-t_import) )
 
+t_import = perf_counter()
+splash.showMessage("Importing widgets...", Qt.AlignTop| Qt.AlignLeft, Qt.white)
 from gui import StageWidget,CameraWidget,LaserWidget,FilterWheelWidget,PwmWidget,ZLockWidget
 from gui import IconProvider,create_iconized_button,create_spinbox,create_doublespinbox,update_iconized_button
+import_profile.append( ('gui',perf_counter()-t_import) )
 
-from core import Worker, ZLock
-from os.path import join,normpath
-
-import numpy as np
-
-import qtmodern.styles
+print('Import profile:')
+for module_name,sec in import_profile:
+    print(f'    {module_name:<24}{1000*sec:8.0f} ms')
 
 # def custom_assert_handler(exc_type, exc_value, exc_traceback):
 #     QMessageBox.critical(None, str(exc_type.__name__), str(exc_value))
@@ -53,53 +85,43 @@ class MainWindow(QMainWindow):
         
         ########################################################### Create all Hardware
         
-        message = 'Loading main camera...'
-        self.main_cam = DummyCamera("Main_Camera") if self.dummies else HamamatsuCamera("Main_Camera")
-        # self.main_cam = DummyCamera("Main_Camera")
+        # Independent devices are opened concurrently, the slowest one sets the pace
+        loader = DeviceLoader()
+        loader.add('Main camera'     ,lambda: DummyCamera("Main_Camera") if self.dummies else HamamatsuCamera("Main_Camera"))
+        loader.add('Auxiliary camera',lambda: DummyBeadCamera("Aux_Camera") if self.dummies else PySpinCamera("Aux_Camera"))
+        loader.add('Stage controller',lambda: DummyStage('Stage') if self.dummies else AttoCubeStage('Stage',com_port='COM5'))
+        loader.add('Filter wheel'    ,lambda: DummyFilterWheel('FilterWheel') if self.dummies else ThorlabsFilterWheel('FilterWheel'))
+        # loader.add('Laser 405nm'     ,lambda: DummyLaser('Laser405') if self.dummies else MicroFPGALaser('Laser405')) # uFPGA
+        loader.add('Laser 405nm'     ,lambda: DummyLaser('Laser405') if self.dummies else TopticaIBeamLaser('Laser405',com_port='COM13')) # Toptica iBeam
+        loader.add('Laser 488nm'     ,lambda: DummyLaser('Laser488') if self.dummies else TopticaIBeamLaser('Laser488',com_port='COM3')) # Toptica iBeam
+        loader.add('Laser 561nm'     ,lambda: DummyLaser('Laser561'))
+        # loader.add('Laser 640nm'     ,lambda: DummyLaser('Laser640') if self.dummies else OmicronLaser_PycroManager('Laser640')) # Omicron PycroManager (Must be the last one on the list)
+        loader.add('Laser 640nm'     ,lambda: DummyLaser('Laser640') if self.dummies else MicroFPGALaser('Laser640')) # uFPGA
+        
+        message = 'Loading devices...'
         splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
+        def report_device(key,ms):
+            nonlocal message
+            status = 'FAILED' if ms is None else f'{ms/1000:.1f} s'
+            message = f'{message}\n{key}: {status}'
+            splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
+        devices = loader.run(report=report_device)
         
-        message = f'{message}\nLoading auxiliary camera...'
-        self.aux_cam  = DummyCamera("Aux_Camera") if self.dummies else PySpinCamera("Aux_Camera")
-        # self.aux_cam  = DummyCamera("Aux_Camera")
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
+        self.main_cam = devices['Main camera']
+        self.aux_cam  = devices['Auxiliary camera']
         
-        message = f'{message}\nLoading stage controller...'
-        stage_driver = DummyStage('Stage') if self.dummies else AttoCubeStage('Stage',com_port='COM5')
+        stage_driver = devices['Stage controller']
         stage_driver.show_commands = True
         stage_driver.set_configuration(init_voltage_offset=65)
         self.dev_manager.add(stage_driver)
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
-        
-        message = f'{message}\nLoading filter wheel...'
-        filterwheel = DummyFilterWheel('FilterWheel') if self.dummies else ThorlabsFilterWheel('FilterWheel')
-        self.dev_manager.add(filterwheel)
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
-        
-        message = f'{message}\nLoading laser 405nm...'
-        # laser_405 = DummyLaser('Laser405')
-        # laser_405 = DummyLaser('Laser405') if self.dummies else MicroFPGALaser('Laser405') # uFPGA
-        laser_405 = DummyLaser('Laser405') if self.dummies else TopticaIBeamLaser('Laser405',com_port='COM13') # Toptica iBeam
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
-        
-        message = f'{message}\nLoading laser 488nm...'
-        # laser_488 = DummyLaser('Laser488')
-        laser_488 = DummyLaser('Laser488') if self.dummies else TopticaIBeamLaser('Laser488',com_port='COM3') # Toptica iBeam
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
-        
-        message = f'{message}\nLoading laser 561nm...'
-        laser_561 = DummyLaser('Laser561')
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
-        
-        message = f'{message}\nLoading laser 640nm...'
-        # laser_640 = DummyLaser('Laser640')
-        # laser_640 = DummyLaser('Laser640') if self.dummies else OmicronLaser_PycroManager('Laser640') # Omicron PycroManager (Must be the last one on the list)
-        laser_640 = DummyLaser('Laser640') if self.dummies else MicroFPGALaser('Laser640') # uFPGA
-        splash.showMessage(message,Qt.AlignTop| Qt.AlignLeft, Qt.white)
+        if self.dummies:
+            self.aux_cam.set_stage(stage_driver)
         
-        self.dev_manager.add(laser_405)
-        self.dev_manager.add(laser_488)
-        self.dev_manager.add(laser_561)
-        self.dev_manager.add(laser_640)
+        self.dev_manager.add(devices['Filter wheel'])
+        self.dev_manager.add(devices['Laser 405nm'])
+        self.dev_manager.add(devices['Laser 488nm'])
+        self.dev_manager.add(devices['Laser 561nm'])
+        self.dev_manager.add(devices['Laser 640nm'])
         
         ########################################################### TOP
         
@@ -790,6 +812,7 @@ class MainWindow(QMainWindow):
         colors = ('#80EF80','#E5F489','#FFEE8C','#FF9D37','#FF6060','#BEBEBE')
         layout.addWidget(FilterWheelWidget(self.dev_manager.FilterWheel,'Filter Wheel',names,colors,vertical=False))
         self.dev_manager.FilterWheel.pos_names = names
+        self.dev_manager.FilterWheel.state_changed()
         
         widget.setTitle('Filter Wheel')
         widget.setLayout(layout)
@@ -810,20 +833,10 @@ class MainWindow(QMainWindow):
         
         return widget
 
-app = QApplication.instance()  # Check if QApplication is already running
-if not app:  
-    app = QApplication(sys.argv)
-qtmodern.styles.dark(app)
-app.setKeyboardInputInterval(60)
-app.setWindowIcon( QIcon('resources/microscope.svg') )
-
 icon_prov = IconProvider()
 icon_prov.load_dark_mode()
 
-#splash = QSplashScreen(flags=Qt.WindowStaysOnTopHint)
-splash = QSplashScreen()
-splash.showMessage("Starting...", Qt.AlignBottom | Qt.AlignCenter, Qt.white)
-splash.show()
+warmup_kernels(report=lambda msg: splash.showMessage(f'Compiling kernels...\n{msg}',Qt.AlignTop| Qt.AlignLeft, Qt.white))
 
 window = MainWindow(splash,dummies=False)
 splash.finish(window)
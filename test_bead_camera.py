@@ -0,0 +1,36 @@
+import numpy as np
+from hardware.cameras import DummyBeadCamera
+
+def _moments(frame,background):
+    signal = np.clip(frame.astype(np.float64)-background,0,None)
+    y,x = np.indices(frame.shape)
+    total = signal.sum()
+    cx = (x*signal).sum()/total
+    cy = (y*signal).sum()/total
+    sx = np.sqrt(((x-cx)**2*signal).sum()/total)
+    sy = np.sqrt(((y-cy)**2*signal).sum()/total)
+    return cx,cy,sx,sy
+
+def _snap(camera):
+    frame = np.zeros((camera.chip_size,camera.chip_size),np.uint16)
+    return camera._gen_frame(frame)
+
+def test_bead_position_and_astigmatism():
+    camera = DummyBeadCamera('Beads',chip_size=64,noise_model='none')
+    camera.set_beads([(20.0,40.0,4000.0)])
+    
+    camera.z_offset_nm = -600.0
+    cx,cy,sx,sy = _moments(_snap(camera),camera.background)
+    assert abs(cx-20) < 0.5 and abs(cy-40) < 0.5
+    assert sx > 1.2*sy # below focus the PSF is elongated along x
+    
+    camera.z_offset_nm = 600.0
+    _,_,sx,sy = _moments(_snap(camera),camera.background)
+    assert sy > 1.2*sx
+
+def test_bead_noise_is_reproducible():
+    frames = []
+    for _ in range(2):
+        camera = DummyBeadCamera('Beads',chip_size=32,noise_model='poisson',seed=3)
+        frames.append(_snap(camera))
+    assert np.array_equal(frames[0],frames[1])
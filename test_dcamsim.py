@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from time import sleep
+from hardware.cameras import HamamatsuCamera
+
+pytestmark = pytest.mark.skipif(HamamatsuCamera.__name__ != 'HamamatsuCamera',reason='DCAM simulator not loaded')
+
+@pytest.fixture(scope='module')
+def camera():
+    # The DCAM API is initialised once per process
+    return HamamatsuCamera('Main_Camera',exposure_time_ms=10,n_buffers=4)
+
+def _acquire(camera,n_frames,delay_s=0.0):
+    frames = []
+    def got(seq):
+        host_time,hw_time,hw_index = camera.get_frame_stamps(seq)
+        frames.append((hw_index,hw_time,camera.get_frame(seq)[:8,:8].copy()))
+        sleep(delay_s)
+    camera.frame_ready.connect(got)
+    camera.acquire_n_frames(n_frames)
+    camera.frame_ready.disconnect(got)
+    return frames
+
+def _check_frames(frames):
+    # Frame k of the simulator is a fixed pattern plus k % 256
+    indices = [hw_index for hw_index,_,_ in frames]
+    assert all(b > a for a,b in zip(indices,indices[1:]))
+    assert all(np.isfinite(hw_time) for _,hw_time,_ in frames)
+    pattern = frames[0][2].astype(np.int64) - indices[0]%256
+    for hw_index,_,data in frames:
+        assert np.array_equal(data.astype(np.int64) - hw_index%256,pattern)
+
+@pytest.mark.parametrize('drain',[True,False])
+def test_acquire_fast_consumer(camera,drain):
+    camera.drain_all_frames = drain
+    frames = _acquire(camera,20)
+    assert len(frames) == 20
+    _check_frames(frames)
+    assert camera.dropped_frames >= 0
+    if drain:
+        assert [hw_index for hw_index,_,_ in frames] == list(range(20))
+
+@pytest.mark.parametrize('drain',[True,False])
+def test_acquire_slow_consumer(camera,drain):
+    # The consumer is slower than the camera, frames are skipped but the
+    # published ones are consistent and never repeated
+    camera.drain_all_frames = drain
+    frames = _acquire(camera,15,delay_s=0.03)
+    assert len(frames) == 15
+    _check_frames(frames)
+    assert camera.dropped_frames > 0
+
+def test_host_ring_is_independent_of_dcam_buffers(camera):
+    assert camera.n_buffers == 4
+    assert camera.frame_ring.n_slots == 8
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from core.utils import KERNEL_SIGNATURES,warmup_kernels
+from core.utils import render_u16_lut,get_histogram_u16,build_display_lut
+
+def _render_reference(frame,lut,orientation,binning):
+    n_rows,n_cols = frame.shape
+    n_out_rows = -(-n_rows//binning)
+    n_out_cols = -(-n_cols//binning)
+    padded = np.zeros((n_out_rows*binning,n_out_cols*binning),frame.dtype)
+    padded[:n_rows,:n_cols] = frame
+    block_max = padded.reshape(n_out_rows,binning,n_out_cols,binning).max(axis=(1,3))
+    if orientation > 0:
+        block_max = block_max[::-1,:]
+    if orientation == 2:
+        block_max = block_max[:,::-1]
+    return lut[block_max]
+
+def test_warmup_compiles_every_signature():
+    timings = warmup_kernels()
+    assert [name for name,_ in timings] == [kernel.__name__ for kernel,_ in KERNEL_SIGNATURES]
+    for kernel,signatures in KERNEL_SIGNATURES:
+        assert len(kernel.signatures) >= len(signatures)
+
+@pytest.mark.parametrize('colormap',['gray','hot'])
+@pytest.mark.parametrize('orientation',[0,1,2])
+@pytest.mark.parametrize('binning',[1,2,3])
+def test_render_u16_lut_matches_numpy(colormap,orientation,binning):
+    rng   = np.random.default_rng(orientation+10*binning)
+    frame = rng.integers(0,65536,(37,50)).astype(np.uint16)
+    lut   = build_display_lut(1000,60000,0.8,colormap)
+    out   = np.zeros((-(-37//binning),-(-50//binning)),lut.dtype)
+    hist  = np.zeros(65536,np.int64)
+    
+    render_u16_lut(frame,out,hist,orientation,lut,binning)
+    
+    assert np.array_equal(out,_render_reference(frame,lut,orientation,binning))
+    assert np.array_equal(hist,np.bincount(frame.ravel(),minlength=65536))
+
+def test_histogram_u16():
+    frame = np.arange(0,65536,7,dtype=np.uint16)[:4096].reshape(64,64)
+    hist  = np.zeros(65536,np.int64)
+    get_histogram_u16(frame,hist)
+    assert np.array_equal(hist,np.bincount(frame.ravel(),minlength=65536))
@@ -0,0 +1,73 @@
+import numpy as np
+from datetime import datetime
+from core.metadata import FrameMetadataWriter,load_frame_metadata,convert_csv_metadata
+from core.metadata import load_metadata_info,load_epoch_host_time
+
+def test_writer_round_trip(tmp_path):
+    writer = FrameMetadataWriter(str(tmp_path/'meta'),host_clock_offset=1000.0,chunk_size=4)
+    for i in range(10):
+        writer.append(frame_index=i,host_time=0.5*i,hw_timestamp=np.nan,hw_frame_index=-1,
+                      x=i,y=-i,z=2*i,laser_index=np.nan,laser_power=1.5,filter_pos=3,state_version=i//2)
+    writer.close()
+    
+    metadata = load_frame_metadata(str(tmp_path/'meta'))
+    assert isinstance(metadata['frame_index'],np.memmap)
+    assert np.array_equal(metadata['frame_index'],np.arange(10))
+    assert np.allclose(metadata['host_time'],0.5*np.arange(10))
+    assert np.array_equal(metadata['y'],-np.arange(10))
+    assert np.all(np.isnan(metadata['hw_timestamp']))
+    assert np.array_equal(metadata['state_version'],np.arange(10)//2)
+    
+    info = load_metadata_info(str(tmp_path/'meta'))
+    assert info['host_time_base'] == 'perf_counter' and info['host_clock_offset'] == 1000.0
+    assert np.allclose(load_epoch_host_time(str(tmp_path/'meta')),1000+0.5*np.arange(10))
+
+def test_convert_original_csv(tmp_path):
+    t0 = datetime(2024,5,1,12,0,0,250000)
+    csv_file = tmp_path/'dataset.csv'
+    csv_file.write_text('#N_FRAME,TIMESTAMP,X,Y,Z,LASER_INDEX,LASER_ON_NAME,LASER_VALUE,LASER_UNIT,FILTER_WHEEL_POS,FILTER_WHEEL_NAME\n'
+                        f'0,{str(t0)},10,20,30,none,0,0,none,2,GFP\n'
+                        f'1,{str(t0)},11,21,31,1,Laser488,12.5,mW,3,RFP\n')
+    
+    path     = convert_csv_metadata(str(csv_file))
+    metadata = load_frame_metadata(path)
+    assert load_metadata_info(path)['host_time_base'] == 'epoch'
+    assert np.allclose(load_epoch_host_time(path),t0.timestamp())
+    assert np.array_equal(metadata['frame_index'],[0,1])
+    assert np.allclose(metadata['host_time'],t0.timestamp())
+    assert np.array_equal(metadata['x'],[10,11])
+    assert np.array_equal(metadata['y'],[20,21])
+    assert np.array_equal(metadata['z'],[30,31])
+    assert np.isnan(metadata['laser_index'][0]) and metadata['laser_index'][1] == 1
+    assert np.array_equal(metadata['laser_power'],[0,12.5])
+    assert np.array_equal(metadata['filter_pos'],[2,3])
+    assert np.all(np.isnan(metadata['hw_timestamp']))
+    assert np.array_equal(metadata['hw_frame_index'],[-1,-1])
+    assert np.array_equal(metadata['state_version'],[0,0])
+
+def test_convert_current_csv(tmp_path):
+    csv_file = tmp_path/'dataset.csv'
+    csv_file.write_text('#N_FRAME,HOST_TIME,HW_TIMESTAMP,HW_FRAME_INDEX,X,Y,Z,LASER_INDEX,LASER_ON_NAME,LASER_VALUE,LASER_UNIT,FILTER_WHEEL_POS,FILTER_WHEEL_NAME,STATE_VERSION\n'
+                        '# HOST_CLOCK_OFFSET=1700000000.500000\n'
+                        '0,100.000000,nan,-1,1,2,3,none,0,0,none,0,0,4\n'
+                        '1,100.010000,5.250000,7,1,2,4,0.1,FPGA.1,50.0,%,1,1,5\n')
+    
+    path     = convert_csv_metadata(str(csv_file),str(tmp_path/'out'))
+    metadata = load_frame_metadata(path)
+    assert np.allclose(metadata['host_time'],[100.0,100.01])
+    assert load_metadata_info(path)['host_time_base'] == 'perf_counter'
+    assert np.allclose(load_epoch_host_time(path),[1700000100.5,1700000100.51])
+    assert np.isnan(metadata['hw_timestamp'][0]) and metadata['hw_timestamp'][1] == 5.25
+    assert np.array_equal(metadata['hw_frame_index'],[-1,7])
+    assert np.array_equal(metadata['z'],[3,4])
+    assert np.isclose(metadata['laser_index'][1],0.1)
+    assert np.array_equal(metadata['filter_pos'],[0,1])
+    assert np.array_equal(metadata['state_version'],[4,5])
+
+def test_convert_csv_without_clock_offset(tmp_path):
+    csv_file = tmp_path/'dataset.csv'
+    csv_file.write_text('#N_FRAME,HOST_TIME,HW_TIMESTAMP,HW_FRAME_INDEX,X,Y,Z,LASER_INDEX,LASER_ON_NAME,LASER_VALUE,LASER_UNIT,FILTER_WHEEL_POS,FILTER_WHEEL_NAME\n'
+                        '0,100.000000,nan,-1,1,2,3,none,0,0,none,0,0\n')
+    path = convert_csv_metadata(str(csv_file))
+    assert load_metadata_info(path)['host_clock_offset'] is None
+    assert load_epoch_host_time(path) is None
@@ -0,0 +1,68 @@
+import numpy as np
+from time import perf_counter,sleep
+from gui.camera_widgets import FrameWriteQueue
+
+def _entry(i,spill_dir=None):
+    return {'seq': i, 'frame': np.full((4,4),i,np.uint16), 'spill_dir': spill_dir}
+
+def _wait_for(condition,timeout_s=5):
+    t_end = perf_counter() + timeout_s
+    while not condition() and perf_counter() < t_end:
+        sleep(0.01)
+    return condition()
+
+def _drain(queue):
+    frames = []
+    while (item := queue.get()) is not None:
+        command,args = item
+        if command == 'frame':
+            frames.append(int(args['frame'][0,0]))
+    return frames
+
+def test_drop_policy():
+    queue = FrameWriteQueue(max_frames=4,policy='drop')
+    accepted = [queue.put_frame(_entry(i)) for i in range(6)]
+    assert accepted == [True]*4 + [False]*2
+    assert queue.n_dropped == 2
+    assert _drain(queue) == [0,1,2,3]
+    assert queue.n_memory == 0
+
+def test_spill_policy(tmp_path):
+    queue = FrameWriteQueue(max_frames=4,policy='spill')
+    queue.put_command('start')
+    assert all(queue.put_frame(_entry(i,str(tmp_path))) for i in range(12))
+    
+    # The spill thread moves the frames beyond max_frames to disk
+    assert _wait_for(lambda: queue.n_memory == 4)
+    assert queue.n_spilled == 8
+    assert queue.n_dropped == 0
+    assert len(list(tmp_path.iterdir())) == 8
+    
+    assert _drain(queue) == list(range(12))
+    assert len(list(tmp_path.iterdir())) == 0
+    queue.close()
+
+def test_spill_failure_drops_frame(tmp_path):
+    blocker = tmp_path/'not_a_dir'
+    blocker.write_text('')
+    queue = FrameWriteQueue(max_frames=2,policy='spill')
+    assert all(queue.put_frame(_entry(i,str(blocker/'spill'))) for i in range(5))
+    assert _wait_for(lambda: queue.n_memory == 2)
+    assert queue.n_dropped == 3
+    assert _drain(queue) == [0,1]
+    queue.close()
+
+def test_block_policy_released_by_reader():
+    from threading import Thread
+    queue  = FrameWriteQueue(max_frames=2,policy='block')
+    thread = Thread(target=lambda: [queue.put_frame(_entry(i)) for i in range(5)])
+    thread.start()
+    frames = []
+    while len(frames) < 5:
+        item = queue.get()
+        if item is not None:
+            frames.append(int(item[1]['frame'][0,0]))
+    thread.join(timeout=5)
+    assert frames == [0,1,2,3,4]
+    assert queue.max_depth <= 2
+    assert queue.n_dropped == 0